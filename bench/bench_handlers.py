@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""Benchmarks the throughput of the fixie data handlers under concurrent load.
+
+Usage: python bench/bench_handlers.py [--requests N] [--concurrency C] [--paths P]
+"""
+import os
+import time
+import shutil
+import argparse
+import tempfile
+
+import tornado.web
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado.httpserver import HTTPServer
+from tornado.testing import bind_unused_port
+
+from fixie import json, fetch
+from fixie import environ
+from fixie.environ import ENV
+
+import fixie_data.paths
+from fixie_data.handlers import HANDLERS
+
+
+USER = 'bench'
+
+
+def always_verify_user(user, token):
+    return True, 'User verified', True
+
+
+def _init_user_paths(npaths):
+    sims = ENV['FIXIE_SIMS_DIR']
+    os.makedirs(sims, exist_ok=True)
+    os.makedirs(fixie_data.paths._user_dir(USER), exist_ok=True)
+    paths = {}
+    for i in range(npaths):
+        path = '/sweep/run-{0}'.format(i)
+        fname = os.path.join(sims, '{0}.txt'.format(i))
+        with open(fname, 'w') as f:
+            f.write('run ' + str(i))
+        paths[path] = {'user': USER, 'holding': 'inf', 'path': path,
+                       'created': time.time(), 'file': fname, 'jobid': i}
+    with open(fixie_data.paths._user_path_file(USER), 'w') as f:
+        json.dump(paths, f, indent=1)
+
+
+async def _load(url, body, nrequests, concurrency):
+    t0 = time.time()
+    remaining = nrequests
+    while remaining > 0:
+        n = min(concurrency, remaining)
+        await gen.multi([fetch(url, body) for i in range(n)])
+        remaining -= n
+    return nrequests / (time.time() - t0)
+
+
+async def _bench(base_url, ns):
+    results = {}
+    body = {'user': USER, 'token': '42'}
+    results['/listpaths'] = await _load(base_url + '/listpaths', body,
+                                        ns.requests, ns.concurrency)
+    body = {'user': USER, 'token': '42', 'pattern': '/sweep/run-1*'}
+    results['/info'] = await _load(base_url + '/info', body,
+                                   ns.requests, ns.concurrency)
+    body = {'user': USER, 'token': '42', 'path': '/sweep/run-0', 'url': False}
+    results['/fetch'] = await _load(base_url + '/fetch', body,
+                                    ns.requests, ns.concurrency)
+    return results
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--paths', type=int, default=1000)
+    ns = parser.parse_args(args)
+    fixie_data.paths.verify_user = always_verify_user
+    d = tempfile.mkdtemp()
+    try:
+        with ENV.swap(XDG_DATA_HOME=os.path.join(d, 'share'),
+                      XDG_CONFIG_HOME=os.path.join(d, 'config')):
+            with environ.context():
+                _init_user_paths(ns.paths)
+                sock, port = bind_unused_port()
+                server = HTTPServer(tornado.web.Application(HANDLERS))
+                server.add_sockets([sock])
+                base_url = 'http://127.0.0.1:{0}'.format(port)
+                results = IOLoop.current().run_sync(lambda: _bench(base_url, ns))
+                server.stop()
+    finally:
+        shutil.rmtree(d)
+    for endpoint, rate in results.items():
+        print('{0:<12} {1:10.1f} requests/s'.format(endpoint, rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Tracking of when paths were last accessed, and how often. Accesses are
+accumulated in memory and periodically written back to the path store in a
+single batch, never synchronously per request.
+"""
+import os
+import time
+import atexit
+import threading
+
+
+class AccessLog(object):
+    """Accumulates path accesses in memory, to be flushed in batches. Flushing
+    happens in a background thread every interval seconds, which is started on
+    the first recorded access, and at exit.
+    """
+
+    def __init__(self, writer, interval=60.0):
+        """
+        Parameters
+        ----------
+        writer : callable
+            Function that writes a batch of accesses back to the path store. It
+            receives a dict mapping users to dicts that map paths to
+            ``(last access time, number of accesses, table queries)`` triples,
+            where table queries maps table names to the number of times they
+            were queried.
+        interval : float, optional
+            Time between flushes, in seconds.
+        """
+        self.writer = writer
+        self.interval = interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        atexit.register(self.flush)
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def record(self, user, paths, t=None, table=None):
+        """Records an access of one or more paths of a user, optionally noting
+        the name of the table that was queried.
+        """
+        t = time.time() if t is None else t
+        if isinstance(paths, str):
+            paths = [paths]
+        with self._lock:
+            accesses = self._pending.setdefault(user, {})
+            for path in paths:
+                last, count, tables = accesses.get(path, (t, 0, {}))
+                if table is not None:
+                    tables[table] = tables.get(table, 0) + 1
+                accesses[path] = (max(last, t), count + 1, tables)
+        self.start()
+
+    def get(self, user, path):
+        """Returns the ``(last access time, number of accesses, table queries)``
+        triple for a path that has not yet been flushed, or None.
+        """
+        with self._lock:
+            return self._pending.get(user, {}).get(path, None)
+
+    def merge(self, user, info):
+        """Returns a copy of a path info dict with the unflushed accesses of the
+        path merged into its 'accessed' and 'accesses' fields.
+        """
+        info = dict(info)
+        info.setdefault('accessed', None)
+        info.setdefault('accesses', 0)
+        pending = self.get(user, info['path'])
+        if pending is not None:
+            last, count, _ = pending
+            info['accessed'] = last if info['accessed'] is None else \
+                               max(info['accessed'], last)
+            info['accesses'] += count
+        return info
+
+    def flush(self):
+        """Writes all accumulated accesses back to the path store in one batch.
+        Accesses that could not be written are kept for the next flush.
+        """
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return
+        try:
+            failed = self.writer(batch) or {}
+        except Exception:
+            failed = batch
+        if not failed:
+            return
+        with self._lock:
+            for user, accesses in failed.items():
+                current = self._pending.setdefault(user, {})
+                for path, (last, count, tables) in accesses.items():
+                    clast, ccount, ctables = current.get(path, (last, 0, {}))
+                    for name, n in tables.items():
+                        ctables[name] = ctables.get(name, 0) + n
+                    current[path] = (max(last, clast), count + ccount, ctables)
+
+    def _after_fork(self):
+        # the parent process flushes its own accesses, and the flushing thread
+        # does not survive the fork
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                pass  # keep the thread alive for the next flush
+
+    def start(self):
+        """Starts the background flushing thread, if it is not running."""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True,
+                                            name='fixie-data-access-log')
+            self._thread.start()
+
+    def stop(self):
+        """Stops the background flushing thread and flushes."""
+        thread = self._thread
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+            self._thread = None
+        self.flush()
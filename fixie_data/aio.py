@@ -0,0 +1,122 @@
+"""Asynchronous interface to fixie data paths, for use inside the Tornado server.
+Each function here mirrors the function of the same name (without the leading
+'a') in ``fixie_data.paths``. Blocking file I/O and file locking are run in a
+thread pool executor so that a slow filesystem does not stall the event loop.
+"""
+import os
+import asyncio
+import functools
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from fixie_data.paths import (listpaths, info, fetch, delete, delete_many, table,
+    compare, schema, usage, gc)
+
+
+AIO_WORKERS = 16
+_EXECUTOR = None
+_LOCKS = weakref.WeakKeyDictionary()
+
+
+def executor():
+    """Returns the executor that blocking path operations run in. It is created
+    on first use so that forked server processes each get their own.
+    """
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        _EXECUTOR = ThreadPoolExecutor(max_workers=AIO_WORKERS)
+    return _EXECUTOR
+
+
+def _after_fork():
+    global _EXECUTOR
+    _EXECUTOR = None
+    _LOCKS.clear()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+async def run(func, *args, **kwargs):
+    """Runs a blocking function in the executor and returns its result."""
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(executor(),
+                                      functools.partial(func, *args, **kwargs))
+
+
+def _lock(name):
+    """Returns an asyncio lock for a name that is specific to the running loop.
+    These locks serialize modifications of the same user paths file within a
+    process, so that executor threads are not tied up waiting on ``flock()``.
+    """
+    loop = asyncio.get_event_loop()
+    locks = _LOCKS.get(loop, None)
+    if locks is None:
+        locks = _LOCKS[loop] = {}
+    lock = locks.get(name, None)
+    if lock is None:
+        lock = locks[name] = asyncio.Lock()
+    return lock
+
+
+async def alistpaths(user, token, pattern=None, **kwargs):
+    """Asynchronous version of ``fixie_data.paths.listpaths()``."""
+    return await run(listpaths, user, token, pattern=pattern, **kwargs)
+
+
+async def ainfo(user, token, paths=None, pattern=None, **kwargs):
+    """Asynchronous version of ``fixie_data.paths.info()``."""
+    return await run(info, user, token, paths=paths, pattern=pattern, **kwargs)
+
+
+async def afetch(path, user, token, url=True, **kwargs):
+    """Asynchronous version of ``fixie_data.paths.fetch()``."""
+    return await run(fetch, path, user, token, url=url, **kwargs)
+
+
+async def adelete(path, user, token, **kwargs):
+    """Asynchronous version of ``fixie_data.paths.delete()``."""
+    async with _lock(user):
+        return await run(delete, path, user, token, **kwargs)
+
+
+async def adelete_many(user, token, paths=None, pattern=None, older_than=None,
+                       **kwargs):
+    """Asynchronous version of ``fixie_data.paths.delete_many()``."""
+    async with _lock(user):
+        return await run(delete_many, user, token, paths=paths, pattern=pattern,
+                         older_than=older_than, **kwargs)
+
+
+async def atable(name, path, user, token, conds=None, columns=None,
+                 format='dataframe', orient='columns', downsample=None, **kwargs):
+    """Asynchronous version of ``fixie_data.paths.table()``."""
+    return await run(table, name, path, user, token, conds=conds, columns=columns,
+                     format=format, orient=orient, downsample=downsample, **kwargs)
+
+
+async def acompare(name, pattern, user, token, conds=None, columns=None,
+                   format='dataframe', orient='columns', **kwargs):
+    """Asynchronous version of ``fixie_data.paths.compare()``."""
+    return await run(compare, name, pattern, user, token, conds=conds,
+                     columns=columns, format=format, orient=orient, **kwargs)
+
+
+async def aschema(path, user, token, **kwargs):
+    """Asynchronous version of ``fixie_data.paths.schema()``."""
+    return await run(schema, path, user, token, **kwargs)
+
+
+async def ausage(user, token, **kwargs):
+    """Asynchronous version of ``fixie_data.paths.usage()``."""
+    return await run(usage, user, token, **kwargs)
+
+
+async def agc(max_bytes=None, max_user_bytes=None, min_holding=0.0, cold_after=None,
+              **kwargs):
+    """Asynchronous version of ``fixie_data.paths.gc()``. Only one garbage
+    collection runs at a time per process.
+    """
+    async with _lock(None):
+        return await run(gc, max_bytes=max_bytes, max_user_bytes=max_user_bytes,
+                         min_holding=min_holding, cold_after=cold_after, **kwargs)
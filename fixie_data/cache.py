@@ -0,0 +1,242 @@
+"""Caches for the fixie data service."""
+import os
+import time
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class TTLCache(object):
+    """A bounded, thread-safe mapping whose entries expire after a fixed
+    time-to-live. When full, the least recently used entry is evicted.
+    Hits and misses are counted so that the effectiveness of the cache
+    may be reported.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60.0, timer=time.monotonic):
+        """
+        Parameters
+        ----------
+        maxsize : int, optional
+            Maximum number of entries held by the cache.
+        ttl : float, optional
+            Time-to-live of each entry, in seconds.
+        timer : callable, optional
+            Function returning the current time, in seconds.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            item = self._data.get(key, None)
+            return item is not None and item[0] > self.timer()
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def get(self, key, default=None):
+        """Returns the value for a key if it is present and has not expired,
+        and default otherwise.
+        """
+        with self._lock:
+            item = self._data.get(key, None)
+            if item is None:
+                self.misses += 1
+                return default
+            expires, value = item
+            if expires <= self.timer():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Sets a value for a key, optionally with a custom time-to-live."""
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._data[key] = (self.timer() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """Removes a key from the cache. If key is None, the whole cache is
+        cleared.
+        """
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def prune(self, predicate):
+        """Removes all entries for which ``predicate(key, value)`` is true."""
+        with self._lock:
+            keys = [k for k, (_, v) in self._data.items() if predicate(k, v)]
+            for key in keys:
+                del self._data[key]
+
+    @property
+    def hit_rate(self):
+        """Fraction of lookups that were hits, zero if there have been none."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        """Returns a dict of cache statistics."""
+        return {'size': len(self._data), 'maxsize': self.maxsize, 'ttl': self.ttl,
+                'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hit_rate}
+
+
+class DiskCache(object):
+    """A bounded cache of picklable values stored as files in a local
+    directory, so that it may be shared by all of the processes of a server.
+    Values are written atomically, and when the cache grows past its maximum
+    size, the least recently used files are removed first. Since values are
+    unpickled, the directory must be private to the server: it is created
+    with mode 0700, and it is not used if it is owned by another user or if
+    other users may access it.
+    """
+
+    def __init__(self, directory, maxbytes=1 << 30):
+        """
+        Parameters
+        ----------
+        directory : str or callable
+            Directory the cache lives in, or a function returning it, so that
+            the directory may depend on the environment at the time of use.
+        maxbytes : int, optional
+            Maximum number of bytes held by the cache.
+        """
+        self._directory = directory
+        self.maxbytes = maxbytes
+        self.hits = 0
+        self.misses = 0
+        self._written = maxbytes  # check the size of the cache on first set
+
+    @property
+    def directory(self):
+        d = self._directory
+        return d() if callable(d) else d
+
+    def _private_directory(self):
+        """Returns the directory of the cache, creating it if needed. Raises
+        PermissionError if the directory is not private to this process's user.
+        """
+        d = self.directory
+        os.makedirs(d, mode=0o700, exist_ok=True)
+        st = os.stat(d)
+        if st.st_uid != os.getuid() or st.st_mode & 0o077:
+            raise PermissionError('Cache directory {0!r} is not private'.format(d))
+        return d
+
+    def _file(self, key, directory=None):
+        d = self.directory if directory is None else directory
+        h = hashlib.sha256(repr(key).encode()).hexdigest()
+        return os.path.join(d, h[:2], h + '.pkl')
+
+    def get(self, key, default=None):
+        """Returns the value for a key if it is present, and default otherwise."""
+        try:
+            filename = self._file(key, self._private_directory())
+            with open(filename, 'rb') as f:
+                stored, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            stored = value = None
+        if stored != key:
+            self.misses += 1
+            return default
+        try:
+            os.utime(filename)
+        except OSError:
+            pass  # removed by another process, the value is still good
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        """Sets a value for a key."""
+        filename = self._file(key, self._private_directory())
+        os.makedirs(os.path.dirname(filename), mode=0o700, exist_ok=True)
+        tmp = '{0}.{1}.{2}.tmp'.format(filename, os.getpid(), threading.get_ident())
+        with open(tmp, 'wb') as f:
+            pickle.dump((key, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            size = f.tell()
+        os.replace(tmp, filename)
+        self._written += size
+        if self._written >= self.maxbytes // 16:
+            self.shrink()
+
+    def _entries(self):
+        entries = []
+        try:
+            subdirs = [e.path for e in os.scandir(self.directory) if e.is_dir()]
+        except OSError:
+            return entries
+        for subdir in subdirs:
+            with os.scandir(subdir) as it:
+                for entry in it:
+                    if not entry.name.endswith('.pkl'):
+                        continue
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+        return entries
+
+    def shrink(self):
+        """Removes the least recently used files until the cache holds at most
+        seven eighths of its maximum size, if it is over its maximum size.
+        """
+        self._written = 0
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        if total <= self.maxbytes:
+            return
+        entries.sort()
+        target = self.maxbytes - self.maxbytes // 8
+        for _, size, filename in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(filename)
+            except OSError:
+                continue
+            total -= size
+
+    def invalidate(self, key=None):
+        """Removes a key from the cache. If key is None, the whole cache is
+        cleared.
+        """
+        if key is None:
+            filenames = [filename for _, _, filename in self._entries()]
+        else:
+            filenames = [self._file(key)]
+        for filename in filenames:
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+    @property
+    def hit_rate(self):
+        """Fraction of lookups that were hits, zero if there have been none."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        """Returns a dict of cache statistics."""
+        return {'maxbytes': self.maxbytes, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hit_rate}
@@ -0,0 +1,194 @@
+"""Columnar sidecars of Cyclus outputs, for fast repeated queries. Each table of
+an output is written to a Parquet file in a sidecar directory next to the
+output, sorted by time and split into row groups with min/max statistics, so
+that a query only reads the columns and row groups that it needs::
+
+    output.h5.columnar/manifest.json
+    output.h5.columnar/0.parquet
+    ...
+
+Sidecars are only used while the output is unchanged since they were written.
+This requires pyarrow, which is an optional dependency.
+"""
+import os
+import json
+import uuid
+import shutil
+
+from lazyasd import lazyobject
+
+
+SIDECAR_SUFFIX = '.columnar'
+MANIFEST_NAME = 'manifest.json'
+SORT_COLUMN = 'Time'
+ROW_GROUP_SIZE = 65536
+
+
+@lazyobject
+def pa():
+    import pyarrow
+    import pyarrow.parquet
+    return pyarrow
+
+
+def available():
+    """Whether columnar sidecars may be written, i.e. pyarrow is installed."""
+    try:
+        pa.parquet
+    except ImportError:
+        return False
+    return True
+
+
+def sidecar_dir(filename):
+    """The columnar sidecar directory of an output."""
+    return filename + SIDECAR_SUFFIX
+
+
+def _source_identity(filename):
+    st = os.stat(filename)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _load_manifest(filename):
+    """Loads the manifest of the sidecar of an output, or returns None if there
+    is no sidecar or it is out of date.
+    """
+    try:
+        with open(os.path.join(sidecar_dir(filename), MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+        if manifest.get('source', None) != _source_identity(filename):
+            return None
+    except (OSError, ValueError):
+        return None
+    return manifest
+
+
+def is_current(filename):
+    """Whether an output has an up to date sidecar."""
+    return _load_manifest(filename) is not None
+
+
+def table_file(filename, table):
+    """The Parquet file of a table in the up to date sidecar of an output, or
+    None if there is no such file.
+    """
+    manifest = _load_manifest(filename)
+    if manifest is None:
+        return None
+    entry = manifest['tables'].get(table, None)
+    if entry is None:
+        return None
+    return os.path.join(sidecar_dir(filename), entry['file'])
+
+
+def _uuid_columns(tbl):
+    return [col for col in tbl.columns if tbl[col].dtype == object and
+            len(tbl) > 0 and isinstance(tbl[col].iloc[0], uuid.UUID)]
+
+
+def write(filename, tables):
+    """Writes the columnar sidecar of an output, replacing any existing one.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the output file.
+    tables : iterable of (str, pandas.DataFrame) pairs
+        Names and contents of the tables of the output. Tables that Parquet
+        cannot represent are skipped.
+
+    Returns
+    -------
+    names : list of str
+        Names of the tables that were written.
+    """
+    # the identity is taken first, so that changes while reading are noticed
+    ident = _source_identity(filename)
+    final = sidecar_dir(filename)
+    tmp = '{0}.tmp-{1}'.format(final, os.getpid())
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    written = {}
+    try:
+        for i, (name, tbl) in enumerate(tables):
+            uuids = _uuid_columns(tbl)
+            if uuids:
+                tbl = tbl.copy()
+                for col in uuids:
+                    tbl[col] = tbl[col].astype(str)
+            if SORT_COLUMN in tbl.columns:
+                tbl = tbl.sort_values(SORT_COLUMN, kind='stable')
+            fname = '{0}.parquet'.format(i)
+            try:
+                at = pa.Table.from_pandas(tbl, preserve_index=False)
+                pa.parquet.write_table(at, os.path.join(tmp, fname),
+                                       row_group_size=ROW_GROUP_SIZE,
+                                       write_statistics=True)
+            except (pa.ArrowException, TypeError, ValueError):
+                continue
+            written[name] = {'file': fname, 'uuid_columns': uuids}
+        with open(os.path.join(tmp, MANIFEST_NAME), 'w') as f:
+            json.dump({'source': ident, 'tables': written}, f, indent=1)
+        shutil.rmtree(final, ignore_errors=True)
+        os.rename(tmp, final)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return sorted(written)
+
+
+def _uuid_str(value):
+    # UUIDs are stored in their canonical string form, however they are given
+    return str(value if isinstance(value, uuid.UUID) else uuid.UUID(value))
+
+
+def _filter_value(value, op, is_uuid):
+    if not is_uuid:
+        return value
+    if op in ('in', 'not in'):
+        return [_uuid_str(v) for v in value]
+    return _uuid_str(value)
+
+
+def query(filename, table, conds=None, columns=None):
+    """Queries a table from the columnar sidecar of an output. Conditions are
+    used to skip the row groups whose statistics rule them out, and only the
+    requested columns are read. Rows are returned in time order.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the output file.
+    table : str
+        Name of the table to query.
+    conds : list of 3-tuples or None, optional
+        Conditions of the form ``(column, operator, value)``, as in
+        ``fixie_data.sqlite.compile_conds()``.
+    columns : list of str or None, optional
+        Columns to return, default all.
+
+    Returns
+    -------
+    table : pandas.DataFrame or None
+        The table, or None if the output has no up to date sidecar for it.
+    """
+    manifest = _load_manifest(filename)
+    if manifest is None:
+        return None
+    entry = manifest['tables'].get(table, None)
+    if entry is None:
+        return None
+    uuids = set(entry['uuid_columns'])
+    filters = None
+    if conds:
+        filters = [(col, op, _filter_value(value, op, col in uuids))
+                   for col, op, value in conds]
+    at = pa.parquet.read_table(os.path.join(sidecar_dir(filename), entry['file']),
+                               columns=list(columns) if columns else None,
+                               filters=filters)
+    df = at.to_pandas()
+    for col in uuids:
+        if col in df.columns:
+            df[col] = df[col].map(uuid.UUID)
+    return df
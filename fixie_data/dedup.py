@@ -0,0 +1,80 @@
+"""Content-addressed deduplication of simulation outputs. Output files are
+hashed and hardlinked into a store in ``$FIXIE_SIMS_DIR/.store``, so that
+identical outputs share a single inode. The number of links to a stored file
+is its reference count, and stored files that are no longer linked to by any
+output are removed by ``prune_store()``.
+"""
+import os
+import hashlib
+
+from fixie import ENV
+
+
+STORE_DIR_NAME = '.store'
+CHUNKSIZE = 1 << 20  # 1 Mb
+
+
+def store_dir():
+    """The content-addressed store directory."""
+    return os.path.join(ENV['FIXIE_SIMS_DIR'], STORE_DIR_NAME)
+
+
+def digest(filename):
+    """Computes the content hash of a file, streaming it in chunks."""
+    h = hashlib.blake2b(digest_size=32)
+    with open(filename, 'rb') as f:
+        while True:
+            b = f.read(CHUNKSIZE)
+            if not b:
+                break
+            h.update(b)
+    return h.hexdigest()
+
+
+def stored_file(d, ext=''):
+    """The file in the store for a content hash."""
+    return os.path.join(store_dir(), d[:2], d + ext)
+
+
+def dedup_file(filename):
+    """Adds a file to the store. If the store already has a file with the same
+    contents, the file is replaced with a hardlink to it. Otherwise the file
+    itself is linked into the store. Returns the content hash of the file.
+    """
+    d = digest(filename)
+    _, ext = os.path.splitext(filename)
+    stored = stored_file(d, ext)
+    os.makedirs(os.path.dirname(stored), exist_ok=True)
+    try:
+        os.link(filename, stored)
+    except FileExistsError:
+        if os.path.samefile(filename, stored):
+            return d
+        tmp = filename + '.dedup'
+        os.link(stored, tmp)
+        os.replace(tmp, filename)
+    return d
+
+
+def prune_store():
+    """Removes the files in the store that are no longer linked to by any
+    output. Returns the number of files removed and a message.
+    """
+    n = 0
+    msg = ''
+    try:
+        subdirs = [e.path for e in os.scandir(store_dir()) if e.is_dir()]
+    except OSError:
+        return n, msg
+    for subdir in subdirs:
+        with os.scandir(subdir) as it:
+            for entry in it:
+                try:
+                    if entry.stat().st_nlink > 1:
+                        continue
+                    os.remove(entry.path)
+                except OSError as e:
+                    msg += str(e) + '\nCould not prune stored file ' + entry.path + '\n\n'
+                    continue
+                n += 1
+    return n, msg
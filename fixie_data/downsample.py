@@ -0,0 +1,125 @@
+"""Downsampling of time series tables for plotting. Clients only need about as
+many points per series as there are pixels to draw them with, so tables are
+reduced to a target number of points per series, after they are queried and
+before they are sent. Each method selects rows, rather than aggregating them,
+so every column of the table is kept.
+"""
+from lazyasd import lazyobject
+
+
+DOWNSAMPLE_BY = ('AgentId',)
+
+
+@lazyobject
+def np():
+    import numpy
+    return numpy
+
+
+def stride(x, y, points):
+    """Selects evenly spaced points, always keeping the first and last."""
+    n = len(x)
+    if n <= points:
+        return np.arange(n)
+    return np.unique(np.linspace(0, n - 1, points).round().astype(int))
+
+
+def minmax(x, y, points):
+    """Selects the minimum and maximum of y in each of points / 2 evenly sized
+    buckets, preserving the envelope of the series.
+    """
+    n = len(x)
+    if n <= points:
+        return np.arange(n)
+    nbuckets = max(points // 2, 1)
+    edges = np.linspace(0, n, nbuckets + 1).astype(int)
+    buckets = np.repeat(np.arange(nbuckets), np.diff(edges))
+    # sorting by y within each bucket puts the minimum first and the maximum last
+    order = np.lexsort((y, buckets))
+    return np.unique(np.concatenate([order[edges[:-1]], order[edges[1:] - 1]]))
+
+
+def lttb(x, y, points):
+    """Selects points with the Largest-Triangle-Three-Buckets algorithm, which
+    keeps the visual shape of the series. The first and last points are
+    always kept, so fewer than 3 points are selected by ``stride()``.
+    """
+    n = len(x)
+    if n <= points:
+        return np.arange(n)
+    elif points < 3:
+        return stride(x, y, points)
+    edges = np.linspace(1, n - 1, points - 1).astype(int)
+    idx = np.empty(points, dtype=int)
+    idx[0] = 0
+    idx[-1] = n - 1
+    a = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i == points - 3:
+            avgx, avgy = x[n - 1], y[n - 1]
+        else:
+            nhi = edges[i + 2]
+            avgx, avgy = x[hi:nhi].mean(), y[hi:nhi].mean()
+        area = np.abs((x[a] - avgx) * (y[lo:hi] - y[a]) -
+                      (x[a] - x[lo:hi]) * (avgy - y[a]))
+        a = lo + int(np.argmax(area))
+        idx[i + 1] = a
+    return idx
+
+
+METHODS = {
+    'stride': stride,
+    'minmax': minmax,
+    'lttb': lttb,
+    }
+
+
+def downsample_table(tbl, points, method='lttb', x='Time', y='Value', by=None):
+    """Downsamples the time series in a table.
+
+    Parameters
+    ----------
+    tbl : pandas.DataFrame
+        The table to downsample.
+    points : int
+        Target number of points per series.
+    method : str, optional
+        Downsampling method, one of 'stride', 'minmax', or 'lttb' (default).
+    x : str, optional
+        Name of the column that series are ordered by.
+    y : str, optional
+        Name of the column of series values.
+    by : list of str or None, optional
+        Columns that identify each series in the table. If None, the columns
+        of ``DOWNSAMPLE_BY`` that are in the table are used.
+
+    Returns
+    -------
+    table : pandas.DataFrame
+        The selected rows of the table, in their original order.
+    """
+    if method not in METHODS:
+        raise ValueError('Downsample method {0!r} not valid'.format(method))
+    if points < 1:
+        raise ValueError('Downsample points must be positive')
+    if by is None:
+        by = [col for col in DOWNSAMPLE_BY if col in tbl.columns]
+    for col in [x, y] + list(by):
+        if col not in tbl.columns:
+            raise ValueError('Downsample column {0!r} not in table'.format(col))
+    if len(tbl) <= points:
+        return tbl
+    select = METHODS[method]
+    xs = np.asarray(tbl[x], dtype=float)
+    ys = np.asarray(tbl[y], dtype=float)
+    if by:
+        groups = tbl.groupby(list(by), sort=False).indices.values()
+    else:
+        groups = [np.arange(len(tbl))]
+    keep = []
+    for pos in groups:
+        pos = pos[np.argsort(xs[pos], kind='stable')]
+        keep.append(pos[select(xs[pos], ys[pos], points)])
+    keep = np.sort(np.concatenate(keep))
+    return tbl.iloc[keep].reset_index(drop=True)
@@ -0,0 +1,41 @@
+"""Garbage collects the outputs held by the fixie data service, so that it may
+be run periodically, e.g. from cron, without starting the server. Expired
+paths are removed, idle paths may be moved into cold storage, and paths are
+evicted least recently used first until usage is within the given limits.
+
+Run with ``python -m fixie_data.gc``.
+"""
+import argparse
+
+from fixie_data.paths import gc
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Cleans up the outputs held by '
+                                                 'the fixie data service.')
+    parser.add_argument('--max-bytes', type=int, default=None, dest='max_bytes',
+                        help='total number of bytes that all outputs may hold.')
+    parser.add_argument('--max-user-bytes', type=int, default=None,
+                        dest='max_user_bytes',
+                        help='number of bytes that the outputs of each user '
+                             'may hold.')
+    parser.add_argument('--min-holding', type=float, default=0.0,
+                        dest='min_holding',
+                        help='minimum age, in seconds, of paths that may be '
+                             'evicted to meet the usage limits.')
+    parser.add_argument('--cold-after', type=float, default=None, dest='cold_after',
+                        help='time since the last access, in seconds, after '
+                             'which outputs are moved into cold storage.')
+    parser.add_argument('--timeout', type=float, default=10.0,
+                        help='how long to wait on each lock, in seconds.')
+    ns = parser.parse_args(args)
+    status, msg = gc(max_bytes=ns.max_bytes, max_user_bytes=ns.max_user_bytes,
+                     min_holding=ns.min_holding, cold_after=ns.cold_after,
+                     timeout=ns.timeout)
+    if msg:
+        print(msg)
+    return 0 if status else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
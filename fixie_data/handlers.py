@@ -1,12 +1,107 @@
 """Tornado handlers for interfacing with fixie data management."""
+import io
 import os
+import uuid
+
+from lazyasd import lazyobject
 
 from fixie import ENV, RequestHandler
 
-from fixie_data.paths import listpaths, info, fetch, delete, table, gc
+from fixie_data.aio import (alistpaths, ainfo, afetch, adelete, adelete_many, atable,
+    acompare, aschema, ausage, agc, run)
+from fixie_data.paths import compare_files, iter_compare, is_schema_indexed
+from fixie_data import warm, tiers
+from fixie_data.scheduler import Rejected, scheduler
+
+
+WARM_START = True
+_STARTED = False
+
+
+def startup():
+    """Runs the startup stage of the fixie data service. This starts warming
+    the caches for the hottest outputs in the background, and so does not delay
+    the server from accepting requests. It is only run once per process.
+
+    Servers should call this before they start their IO loop, as
+    ``fixie_data.server.serve()`` does, so that the caches are warming before
+    the first request arrives. Otherwise, it is run when the first handler in
+    the process is created.
+    """
+    global _STARTED
+    if _STARTED:
+        return
+    _STARTED = True
+    if WARM_START:
+        warm.start()
 
 
-class ListPaths(RequestHandler):
+class DataHandler(RequestHandler):
+    """Base class for fixie data request handlers, which runs the startup stage
+    when the first handler in a process is created. Expensive requests must be
+    admitted by the fair-share scheduler before they run, while cheap requests
+    are run right away.
+    """
+
+    expensive = False
+    _slot = None
+
+    def initialize(self, *args, **kwargs):
+        super().initialize(*args, **kwargs)
+        startup()
+
+    async def is_expensive(self):
+        """Whether the current request is expensive."""
+        return self.expensive
+
+    def queue_name(self):
+        """Name of the scheduler queue that the current request waits in, which
+        is that of its user.
+        """
+        user = self.request.arguments.get('user', None)
+        return user if isinstance(user, str) else ''
+
+    async def prepare(self):
+        super().prepare()
+        if self._finished or not await self.is_expensive():
+            return
+        s = scheduler()
+        try:
+            await s.acquire(self.queue_name())
+        except Rejected as e:
+            self.set_status(503)
+            self.set_header('Retry-After', str(max(int(e.retry_after + 0.5), 1)))
+            self.finish({'status': False, 'message': str(e)})
+            return
+        self._slot = (s, s.timer())
+
+    def _release(self):
+        if self._slot is not None:
+            s, t0 = self._slot
+            self._slot = None
+            s.release(s.timer() - t0)
+
+    def on_finish(self):
+        # the slot is held until the request is done, even if the client has
+        # gone away, since its work still occupies an executor thread
+        self._release()
+        super().on_finish()
+
+
+@lazyobject
+def fixie_json():
+    from fixie import json
+    return json
+
+
+@lazyobject
+def pa():
+    import pyarrow
+    import pyarrow.ipc
+    return pyarrow
+
+
+class ListPaths(DataHandler):
 
     schema = {'user': {'type': 'string', 'empty': False, 'required': True},
               'token': {'type': 'string', 'regex': '[0-9a-fA-F]+', 'required': True},
@@ -14,13 +109,13 @@ class ListPaths(RequestHandler):
               }
     response_keys = ('paths', 'status', 'message')
 
-    def post(self):
-        resp = listpaths(**self.request.arguments)
+    async def post(self):
+        resp = await alistpaths(**self.request.arguments)
         response = dict(zip(self.response_keys, resp))
         self.write(response)
 
 
-class Info(RequestHandler):
+class Info(DataHandler):
 
     schema = {'user': {'type': 'string', 'empty': False, 'required': True},
               'token': {'type': 'string', 'regex': '[0-9a-fA-F]+', 'required': True},
@@ -33,13 +128,13 @@ class Info(RequestHandler):
               }
     response_keys = ('infos', 'status', 'message')
 
-    def post(self):
-        resp = info(**self.request.arguments)
+    async def post(self):
+        resp = await ainfo(**self.request.arguments)
         response = dict(zip(self.response_keys, resp))
         self.write(response)
 
 
-class Fetch(RequestHandler):
+class Fetch(DataHandler):
 
     schema = {'user': {'type': 'string', 'empty': False, 'required': True},
               'token': {'type': 'string', 'regex': '[0-9a-fA-F]+', 'required': True},
@@ -49,7 +144,18 @@ class Fetch(RequestHandler):
     response_keys = ('file', 'status', 'message')
     chunksize = 16384  # 16 Kb
 
-    def get(self, *args, **kwargs):
+    async def is_expensive(self):
+        # downloads and fetching the bytes of a file are expensive, URLs are not
+        return self.request.method == 'GET' or \
+               not self.request.arguments.get('url', True)
+
+    def queue_name(self):
+        # downloads do not carry a user, so they wait in a queue per client
+        if self.request.method == 'GET':
+            return 'client:' + str(self.request.remote_ip)
+        return super().queue_name()
+
+    async def get(self, *args, **kwargs):
         """Actually get a file"""
         files = self.request.arguments['file']
         if len(files) != 1:
@@ -59,38 +165,64 @@ class Fetch(RequestHandler):
         if isinstance(fname, bytes):
             fname = fname.decode('utf-8')
         fname = os.path.join(ENV['FIXIE_SIMS_DIR'], fname)
-        if not os.path.isfile(fname):
+        isfile = await run(os.path.isfile, fname)
+        if not isfile:
             self.send_error(400, message='File not found')
             return
-        with open(fname, 'rb') as f:
+        # files in the cold tier are decompressed as they are sent
+        codec = self.request.arguments.get('codec', [None])[0]
+        if isinstance(codec, bytes):
+            codec = codec.decode('utf-8')
+        if codec not in tiers.SUFFIXES:
+            codec = None
+        f = await run(tiers.open_cold, fname, codec)
+        try:
             while True:
-                b = f.read(self.chunksize)
+                b = await run(f.read, self.chunksize)
                 if not b:
                     break
                 self.write(b)
+                await self.flush()
+        finally:
+            f.close()
         self.finish()
 
-    def post(self, *args, **kwargs):
-        resp = fetch(**self.request.arguments)
+    async def post(self, *args, **kwargs):
+        resp = await afetch(**self.request.arguments)
         response = dict(zip(self.response_keys, resp))
         self.write(response)
 
 
-class Delete(RequestHandler):
+class Delete(DataHandler):
 
     schema = {'user': {'type': 'string', 'empty': False, 'required': True},
               'token': {'type': 'string', 'regex': '[0-9a-fA-F]+', 'required': True},
-              'path': {'type': 'string', 'empty': False, 'required': True},
+              'path': {'type': 'string', 'empty': False,
+                       'excludes': ['paths', 'pattern', 'older_than']},
+              'paths': {'anyof': [
+                {'type': 'string'},
+                {'type': 'list', 'empty': False,
+                 'schema': {'type': 'string', 'empty': False}},
+                ], 'nullable': True, 'excludes': ['path', 'pattern']},
+              'pattern': {'type': 'string', 'nullable': True,
+                          'excludes': ['path', 'paths']},
+              'older_than': {'type': 'number', 'nullable': True, 'excludes': 'path'},
               }
     response_keys = ('status', 'message')
+    many_response_keys = ('results', 'status', 'message')
 
-    def post(self, *args, **kwargs):
-        resp = delete(**self.request.arguments)
-        response = dict(zip(self.response_keys, resp))
+    async def post(self, *args, **kwargs):
+        args = self.request.arguments
+        if 'path' in args:
+            resp = await adelete(**args)
+            response = dict(zip(self.response_keys, resp))
+        else:
+            resp = await adelete_many(**args)
+            response = dict(zip(self.many_response_keys, resp))
         self.write(response)
 
 
-class Table(RequestHandler):
+class Table(DataHandler):
 
     schema = {'name': {'type': 'string', 'empty': False, 'required': True},
               'path': {'type': 'string', 'empty': False, 'required': True},
@@ -100,37 +232,231 @@ class Table(RequestHandler):
                         'schema': {'type': 'list', 'empty': False,
                                    'minlength': 3, 'maxlength': 3},
                         'nullable': True},
+              'columns': {'type': 'list', 'schema': {'type': 'string', 'empty': False},
+                          'nullable': True},
               'format': {'type': 'string', 'allowed': ['json', 'json:str', 'json:dict']},
               'orient': {'type': 'string', 'allowed': ['split', 'records', 'index',
                                                        'columns', 'values']},
+              'downsample': {'type': 'dict', 'nullable': True, 'schema': {
+                'points': {'type': 'integer', 'min': 1, 'required': True},
+                'method': {'type': 'string', 'allowed': ['stride', 'minmax', 'lttb']},
+                'x': {'type': 'string', 'empty': False},
+                'y': {'type': 'string', 'empty': False},
+                'by': {'type': 'list', 'schema': {'type': 'string', 'empty': False}},
+                }},
               }
     response_keys = ('table', 'status', 'message')
+    expensive = True
 
-    def post(self, *args, **kwargs):
+    async def post(self, *args, **kwargs):
         args = self.request.arguments
         if 'format' not in args:
             args['format'] = 'json:dict'
-        resp = table(**args)
+        resp = await atable(**args)
         response = dict(zip(self.response_keys, resp))
         self.write(response)
 
 
-class GC(RequestHandler):
+class NDJSONWriter(object):
+    """Writes tables as newline-delimited JSON records."""
 
-    schema = {}
+    content_type = 'application/x-ndjson'
+
+    def write(self, tbl):
+        s = tbl.to_json(orient='records', lines=True, default_handler=fixie_json.default)
+        return (s.rstrip('\n') + '\n').encode('utf-8')
+
+    def close(self):
+        return b''
+
+
+def _arrow_safe(tbl):
+    """Converts columns that Arrow cannot represent, such as UUIDs, to strings."""
+    for col in tbl.columns:
+        if tbl[col].dtype != object:
+            continue
+        is_uuid = tbl[col].map(lambda x: isinstance(x, uuid.UUID))
+        if is_uuid.any():
+            tbl[col] = tbl[col].where(~is_uuid, tbl[col].astype(str))
+    return tbl
+
+
+class ArrowWriter(object):
+    """Writes tables as record batches of an Arrow IPC stream. The schema of the
+    stream is that of the first non-empty table, and later tables are cast to
+    it. Tables that cannot be cast are skipped, since the stream has already
+    started.
+    """
+
+    content_type = 'application/vnd.apache.arrow.stream'
+
+    def __init__(self):
+        self.sink = io.BytesIO()
+        self.writer = None
+        self.schema = None
+
+    def _flush(self):
+        b = self.sink.getvalue()
+        self.sink.seek(0)
+        self.sink.truncate()
+        return b
+
+    def write(self, tbl):
+        tbl = _arrow_safe(tbl)
+        if self.writer is None:
+            if len(tbl) == 0:
+                return b''  # the types of empty tables are not known
+            batch = pa.RecordBatch.from_pandas(tbl, preserve_index=False)
+            self.schema = batch.schema
+            self.writer = pa.ipc.new_stream(self.sink, self.schema)
+        else:
+            try:
+                batch = pa.RecordBatch.from_pandas(tbl, schema=self.schema,
+                                                   preserve_index=False)
+            except (pa.ArrowException, KeyError, TypeError, ValueError):
+                return b''
+        self.writer.write_batch(batch)
+        return self._flush()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        return self._flush()
+
+
+STREAM_WRITERS = {'ndjson': NDJSONWriter, 'arrow': ArrowWriter}
+
+
+class Compare(DataHandler):
+
+    schema = {'name': {'type': 'string', 'empty': False, 'required': True},
+              'pattern': {'type': 'string', 'empty': False, 'required': True},
+              'user': {'type': 'string', 'empty': False, 'required': True},
+              'token': {'type': 'string', 'regex': '[0-9a-fA-F]+', 'required': True},
+              'conds': {'type': 'list',
+                        'schema': {'type': 'list', 'empty': False,
+                                   'minlength': 3, 'maxlength': 3},
+                        'nullable': True},
+              'columns': {'type': 'list', 'schema': {'type': 'string', 'empty': False},
+                          'nullable': True},
+              'format': {'type': 'string', 'allowed': ['ndjson', 'arrow', 'json',
+                                                       'json:str', 'json:dict']},
+              'orient': {'type': 'string', 'allowed': ['split', 'records', 'index',
+                                                       'columns', 'values']},
+              }
+    response_keys = ('table', 'status', 'message')
+    expensive = True
+
+    async def post(self, *args, **kwargs):
+        """Compares tables across paths. The 'ndjson' (default) and 'arrow' formats
+        stream the table of each path as soon as it is available. Paths whose
+        table could not be loaded are skipped in these formats.
+        """
+        args = self.request.arguments
+        format = args.pop('format', 'ndjson')
+        if format not in STREAM_WRITERS:
+            resp = await acompare(format=format, **args)
+            response = dict(zip(self.response_keys, resp))
+            self.write(response)
+            return
+        if format == 'arrow':
+            try:
+                pa.RecordBatch
+            except ImportError:
+                self.write({'table': None, 'status': False,
+                            'message': 'pyarrow is required for the arrow format'})
+                return
+        name = args.pop('name')
+        conds = args.pop('conds', None)
+        columns = args.pop('columns', None)
+        args.pop('orient', None)
+        files, status, msg = await run(compare_files, **args)
+        if not status or len(files) == 0:
+            msg = msg or 'No paths matched pattern {0!r}'.format(args['pattern'])
+            self.write({'table': None, 'status': False, 'message': msg})
+            return
+        writer = STREAM_WRITERS[format]()
+        self.set_header('Content-Type', writer.content_type)
+        results = iter_compare(files, name, conds=conds, columns=columns)
+        while True:
+            result = await run(next, results, None)
+            if result is None:
+                break
+            path, tbl, msg = result
+            if tbl is None:
+                continue
+            self.write(writer.write(tbl))
+            await self.flush()
+        self.write(writer.close())
+        self.finish()
+
+
+class Schema(DataHandler):
+
+    schema = {'path': {'type': 'string', 'empty': False, 'required': True},
+              'user': {'type': 'string', 'empty': False, 'required': True},
+              'token': {'type': 'string', 'regex': '[0-9a-fA-F]+', 'required': True},
+              }
+    response_keys = ('schema', 'status', 'message')
+
+    async def is_expensive(self):
+        # serving an index that is already built is cheap, building it is not
+        return not await run(is_schema_indexed, **self.request.arguments)
+
+    async def post(self, *args, **kwargs):
+        resp = await aschema(**self.request.arguments)
+        response = dict(zip(self.response_keys, resp))
+        self.write(response)
+
+
+class Usage(DataHandler):
+
+    schema = {'user': {'type': 'string', 'empty': False, 'required': True},
+              'token': {'type': 'string', 'regex': '[0-9a-fA-F]+', 'required': True},
+              }
+    response_keys = ('usage', 'status', 'message')
+
+    async def post(self, *args, **kwargs):
+        resp = await ausage(**self.request.arguments)
+        response = dict(zip(self.response_keys, resp))
+        self.write(response)
+
+
+class GC(DataHandler):
+
+    schema = {'max_bytes': {'type': 'integer', 'min': 0, 'nullable': True},
+              'max_user_bytes': {'type': 'integer', 'min': 0, 'nullable': True},
+              'min_holding': {'type': 'number', 'min': 0.0},
+              'cold_after': {'type': 'number', 'min': 0.0, 'nullable': True},
+              }
     response_keys = ('status', 'message')
+    expensive = True
 
-    def post(self, *args, **kwargs):
-        resp = gc(**self.request.arguments)
+    async def post(self, *args, **kwargs):
+        resp = await agc(**self.request.arguments)
         response = dict(zip(self.response_keys, resp))
         self.write(response)
 
 
+class Metrics(DataHandler):
+
+    schema = {}
+
+    async def get(self, *args, **kwargs):
+        """Reports the metrics of the scheduler."""
+        self.write({'scheduler': scheduler().stats(), 'status': True,
+                    'message': 'Metrics read'})
+
+
 HANDLERS = [
     ('/listpaths', ListPaths),
     ('/info', Info),
     ('/fetch', Fetch),
     ('/delete', Delete),
     ('/table', Table),
+    ('/compare', Compare),
+    ('/schema', Schema),
+    ('/usage', Usage),
     ('/gc', GC),
+    ('/metrics', Metrics),
 ]
@@ -0,0 +1,117 @@
+"""Migrates $FIXIE_PATHS_DIR from the old flat layout, where every user paths
+file and pending path file lived directly in $FIXIE_PATHS_DIR, to the sharded
+layout, where each user has their own directory::
+
+    $FIXIE_PATHS_DIR/username/paths.json
+    $FIXIE_PATHS_DIR/username/pending/*.json
+
+Run with ``python -m fixie_data.migrate``.
+"""
+import os
+import json
+import argparse
+
+from fixie import ENV
+
+from fixie_data.paths import (_LEGACY_PENDING_SUFFIX, _MIGRATED_MARKER, _pending_dir,
+    _legacy_user_path_file, _legacy_pending_files, _update_user_paths)
+
+
+def migrate_user(user, **kwargs):
+    """Moves a single user paths file from the old flat layout into the sharded
+    layout. Entries already present in the sharded paths file take precedence.
+    Returns whether or not the user was migrated.
+    """
+    if 'raise_errors' not in kwargs:
+        kwargs['raise_errors'] = False
+    legacy_file = _legacy_user_path_file(user)
+    if not os.path.isfile(legacy_file):
+        return False
+
+    def update(paths):
+        if not os.path.isfile(legacy_file):
+            return False  # already migrated by another writer
+        with open(legacy_file) as f:
+            legacy = json.load(f)
+        for path, info in legacy.items():
+            paths.setdefault(path, info)
+        return True
+
+    # the update holds the same lock as every other writer of the user's
+    # paths, and writing removes the old flat layout file
+    return _update_user_paths(user, update, **kwargs)
+
+
+def migrate_pending(fname):
+    """Moves a single pending path file from the old flat layout into the
+    pending directory of the user it belongs to. Returns whether or not the
+    file was moved.
+    """
+    with open(fname) as f:
+        pending = json.load(f)
+    user = pending.get('user', None)
+    if not user:
+        return False
+    pending_dir = _pending_dir(user)
+    os.makedirs(pending_dir, exist_ok=True)
+    os.replace(fname, os.path.join(pending_dir, os.path.basename(fname)))
+    return True
+
+
+def migrate(**kwargs):
+    """Migrates all users and pending path files in $FIXIE_PATHS_DIR from the
+    old flat layout to the sharded layout. This may safely be run more than
+    once, and while the server is running. Once the migration completes, a
+    marker file is written, and the server stops looking for pending path
+    files in the old flat layout, so they must no longer be written there.
+
+    Parameters
+    ----------
+    kwargs : other key words
+        Passed into ``fixie.flock()`` when loading user paths file.
+
+    Returns
+    -------
+    status : bool
+        Whether the migration completed.
+    message : str
+        Status message, if needed.
+    """
+    msg = ''
+    paths_dir = ENV['FIXIE_PATHS_DIR']
+    for name in sorted(os.listdir(paths_dir)):
+        if name.startswith('.') or not name.endswith('.json') or \
+                name.endswith(_LEGACY_PENDING_SUFFIX):
+            continue
+        user = name[:-5]
+        if not migrate_user(user, **kwargs):
+            msg += 'Could not migrate paths for user ' + user + '\n\n'
+    for fname in _legacy_pending_files():
+        try:
+            status = migrate_pending(fname)
+        except Exception as e:
+            status = False
+            msg += str(e) + '\n'
+        if not status:
+            msg += 'Could not migrate pending path file ' + fname + '\n\n'
+    if not msg:
+        # the server no longer needs to look for the old flat layout
+        with open(os.path.join(paths_dir, _MIGRATED_MARKER), 'w'):
+            pass
+    return not msg, msg
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Migrates $FIXIE_PATHS_DIR to the '
+                                                 'sharded per-user layout.')
+    parser.add_argument('--timeout', type=float, default=10.0,
+                        help='how long to wait on each lock, in seconds.')
+    ns = parser.parse_args(args)
+    status, msg = migrate(timeout=ns.timeout)
+    if msg:
+        print(msg)
+    return 0 if status else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
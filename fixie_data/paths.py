@@ -1,18 +1,51 @@
 """Manages paths for fixie data service."""
 import os
 import re
-import glob
+import json
 import time
+import stat
+import shutil
 import fnmatch
+import hashlib
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 
 from lazyasd import lazyobject
 
-from fixie import json
 from fixie import ENV, flock, verify_user
 
+from fixie_data import sqlite, columnar, tiers
+from fixie_data.access import AccessLog
+from fixie_data.cache import TTLCache, DiskCache
+from fixie_data.dedup import dedup_file, prune_store
+from fixie_data.downsample import downsample_table
+from fixie_data.usage import load_usage, dump_usage, update_usage
 
-_USER_PATH_FILE_TEMPLATE = '{0}/{1}.json'
+
+_USER_DIR_TEMPLATE = '{0}/{1}'
+_USER_PATH_FILE_TEMPLATE = '{0}/{1}/paths.json'
+_PENDING_DIR_TEMPLATE = '{0}/{1}/pending'
+_LEGACY_USER_PATH_FILE_TEMPLATE = '{0}/{1}.json'
+_LEGACY_PENDING_SUFFIX = '-pending-path.json'
+_MIGRATED_MARKER = '.migrated'
+LEGACY_LAYOUT = None  # None to check for the marker written by fixie_data.migrate
+DELETE_WORKERS = 8
+VERIFY_CACHE = TTLCache(maxsize=1024, ttl=30.0)
+STAT_CACHE = TTLCache(maxsize=65536, ttl=2.0)
+SCANDIR_THRESHOLD = 8
+SCHEMA_CACHE = TTLCache(maxsize=1024, ttl=3600.0)
+_SIDECAR_SUFFIXES = ('.schema.json', columnar.SIDECAR_SUFFIX)
+COMPARE_WORKERS = None  # defaults to the number of processors
+_COMPARE_EXECUTOR = None
+DEDUP_OUTPUTS = False
+_BACKGROUND_EXECUTOR = None
+COLUMNAR_AFTER_RESOLVE = False
+COLUMNAR_AFTER_QUERIES = None
+_CONVERTING = set()
+PATHS_CACHE = TTLCache(maxsize=1024, ttl=3600.0)
+PATHS_CACHE_SETTLE = 1.0
+QUERY_CACHE_DIR = None  # defaults to $XDG_CACHE_HOME/fixie-data/query
+QUERY_CACHE_MIN_TIME = 0.1
 
 
 @lazyobject
@@ -21,25 +54,217 @@ def cyclus_lib():
     return lib
 
 
+@lazyobject
+def pd():
+    import pandas
+    return pandas
+
+
+@lazyobject
+def fixie_json():
+    from fixie import json
+    return json
+
+
+def _file_identity(st):
+    """Identity of the contents of a file from its stat result. Hardlinked
+    duplicates share the same identity.
+    """
+    return st.st_dev, st.st_ino, st.st_mtime_ns
+
+
+def _verify_key(user, token):
+    """Key for a user/token pair in the verification cache."""
+    return hashlib.sha256('{0}\0{1}'.format(user, token).encode()).hexdigest()
+
+
+def _verify_user(user, token):
+    """Verifies a user/token pair, consulting the verification cache first.
+    Only successful verifications are cached.
+    """
+    key = _verify_key(user, token)
+    cached = VERIFY_CACHE.get(key)
+    if cached is not None:
+        return cached[1]
+    rtn = verify_user(user, token)
+    valid, msg, status = rtn
+    if valid and status:
+        VERIFY_CACHE[key] = (user, rtn)
+    return rtn
+
+
+def invalidate_verification(user=None, token=None):
+    """Removes cached verifications. If both user and token are given, only that
+    pair is removed. If only the user is given, all of the user's tokens are
+    removed. Otherwise the whole verification cache is cleared.
+    """
+    if user is None:
+        VERIFY_CACHE.invalidate()
+    elif token is None:
+        VERIFY_CACHE.prune(lambda k, v: v[0] == user)
+    else:
+        VERIFY_CACHE.invalidate(_verify_key(user, token))
+
+
+def _stat(filename):
+    """Returns the stat result for a file, or None if it does not exist. Results
+    are held in the stat cache for a short time. Operations that remove files
+    must call ``_forget_stat()`` to keep the cache consistent.
+    """
+    st = STAT_CACHE.get(filename)
+    if st is None:
+        try:
+            st = os.stat(filename)
+        except OSError:
+            st = False
+        STAT_CACHE[filename] = st
+    return st or None
+
+
+def _isfile(filename):
+    """Cached version of ``os.path.isfile()``."""
+    st = _stat(filename)
+    return st is not None and stat.S_ISREG(st.st_mode)
+
+
+def _forget_stat(filename):
+    """Removes a file from the stat cache."""
+    STAT_CACHE.invalidate(filename)
+
+
+def _existing_files(filenames):
+    """Returns the set of filenames that exist and are regular files. Files are
+    grouped by directory and directories with many candidate files are checked
+    with a single ``os.scandir()`` call rather than one stat per file.
+    """
+    bydir = {}
+    for filename in filenames:
+        d, base = os.path.split(filename)
+        bydir.setdefault(d, {})[base] = filename
+    existing = set()
+    for d, bases in bydir.items():
+        if len(bases) < SCANDIR_THRESHOLD:
+            existing.update(f for f in bases.values() if _isfile(f))
+            continue
+        try:
+            with os.scandir(d or '.') as it:
+                for entry in it:
+                    if entry.name in bases and entry.is_file():
+                        existing.add(bases[entry.name])
+        except OSError:
+            continue
+    return existing
+
+
+def _user_dir(user):
+    """Helper function for making user directory, which holds the user path
+    file and the user's pending path files.
+    """
+    return _USER_DIR_TEMPLATE.format(ENV['FIXIE_PATHS_DIR'], user)
+
+
 def _user_path_file(user):
     """Helper function for making user path file"""
     return _USER_PATH_FILE_TEMPLATE.format(ENV['FIXIE_PATHS_DIR'], user)
 
 
+def _pending_dir(user):
+    """Helper function for making the user pending paths directory"""
+    return _PENDING_DIR_TEMPLATE.format(ENV['FIXIE_PATHS_DIR'], user)
+
+
+def _legacy_user_path_file(user):
+    """Helper function for making user path file in the old flat layout"""
+    return _LEGACY_USER_PATH_FILE_TEMPLATE.format(ENV['FIXIE_PATHS_DIR'], user)
+
+
+def _legacy_pending_files(user=None):
+    """Returns the pending path files in the old flat layout. If a user is given,
+    only file names that start with ``'{user}-'`` are returned. Since user names
+    may themselves contain dashes, the contents of these files must still be
+    checked against the user.
+    """
+    prefix = '' if user is None else user + '-'
+    try:
+        names = os.listdir(ENV['FIXIE_PATHS_DIR'])
+    except OSError:
+        return []
+    return [os.path.join(ENV['FIXIE_PATHS_DIR'], name) for name in sorted(names)
+            if name.startswith(prefix) and name.endswith(_LEGACY_PENDING_SUFFIX)]
+
+
+def _legacy_layout():
+    """Whether pending path files may still be written in the old flat layout.
+    This is the case until ``fixie_data.migrate`` has completed, unless
+    ``LEGACY_LAYOUT`` is set.
+    """
+    if LEGACY_LAYOUT is not None:
+        return LEGACY_LAYOUT
+    return not os.path.exists(os.path.join(ENV['FIXIE_PATHS_DIR'], _MIGRATED_MARKER))
+
+
+def _pending_files(user):
+    """Returns the pending path files for a user, in the sharded layout and, if
+    it is still in use, the old flat layout. Only the latter needs the whole
+    $FIXIE_PATHS_DIR to be listed.
+    """
+    try:
+        names = os.listdir(_pending_dir(user))
+    except OSError:
+        names = []
+    files = [os.path.join(_pending_dir(user), name) for name in sorted(names)
+             if name.endswith('.json')]
+    if _legacy_layout():
+        files.extend(_legacy_pending_files(user))
+    return files
+
+
+def _read_user_paths(filename):
+    """Reads a user paths file. Parsed files are held in the paths cache, keyed
+    on the identity of the file, so that a file is only parsed again once it
+    has been changed by this or any other process. Files modified less than
+    ``PATHS_CACHE_SETTLE`` seconds ago are not cached, since a further change
+    within the resolution of the filesystem timestamps could go unnoticed.
+    """
+    st = os.stat(filename)
+    ident = (st.st_ino, st.st_mtime_ns, st.st_size)
+    cached = PATHS_CACHE.get(filename)
+    if cached is not None and cached[0] == ident:
+        paths = cached[1]
+    else:
+        with open(filename) as f:
+            paths = json.load(f)
+        for info in paths.values():
+            info['holding'] = float(info.get('holding', 'inf'))
+        if time.time() - st.st_mtime >= PATHS_CACHE_SETTLE:
+            PATHS_CACHE[filename] = (ident, paths)
+    return {path: dict(info) for path, info in paths.items()}
+
+
 def _load_user_paths(user_or_file, is_user=True,  **kwargs):
-    """Helper function for loading a user paths file."""
+    """Helper function for loading a user paths file. If a user is given and
+    their paths file does not yet exist, the paths file in the old flat layout
+    is read instead.
+    """
     if 'raise_errors' not in kwargs:
         kwargs['raise_errors'] = False
-    user_path_file = _user_path_file(user_or_file) if is_user else user_or_file
+    if is_user:
+        user_path_file = _user_path_file(user_or_file)
+        if not os.path.isdir(_user_dir(user_or_file)):
+            if not os.path.exists(_legacy_user_path_file(user_or_file)):
+                return {}  # nothing to read, so nothing to lock
+            # the lock lives in the user directory, even for the old layout
+            os.makedirs(_user_dir(user_or_file), exist_ok=True)
+    else:
+        user_path_file = user_or_file
     with flock(user_path_file, **kwargs) as lockfd:
         if lockfd == 0:
             return
-        elif os.path.exists(user_path_file):
-            with open(user_path_file) as f:
-                paths = json.load(f)
-            for info in paths.values():
-                info['holding'] = float(info.get('holding', 'inf'))
-            return paths
+        filename = user_path_file
+        if is_user and not os.path.exists(filename):
+            filename = _legacy_user_path_file(user_or_file)
+        if os.path.exists(filename):
+            return _read_user_paths(filename)
         else:
             return {}
 
@@ -50,6 +275,7 @@ def _dump_user_paths(user, paths, **kwargs):
     """
     if 'raise_errors' not in kwargs:
         kwargs['raise_errors'] = False
+    os.makedirs(_user_dir(user), exist_ok=True)
     user_path_file = _user_path_file(user)
     with flock(user_path_file, **kwargs) as lockfd:
         if lockfd == 0:
@@ -59,40 +285,180 @@ def _dump_user_paths(user, paths, **kwargs):
                 return False
         with open(user_path_file, 'w') as f:
             json.dump(paths, f, indent=1)
+        # the paths now live in the sharded layout
+        legacy_file = _legacy_user_path_file(user)
+        if os.path.exists(legacy_file):
+            os.remove(legacy_file)
+    return True
+
+
+def _update_user_paths(user, update, **kwargs):
+    """Updates a user paths file in place, holding its lock for the whole read,
+    update, and write. The ``update(paths)`` function modifies the paths dict
+    and returns whether anything changed. Returns whether or not the update
+    occurred successfully.
+    """
+    if 'raise_errors' not in kwargs:
+        kwargs['raise_errors'] = False
+    os.makedirs(_user_dir(user), exist_ok=True)
+    user_path_file = _user_path_file(user)
+    legacy_file = _legacy_user_path_file(user)
+    with flock(user_path_file, **kwargs) as lockfd:
+        if lockfd == 0:
+            return False
+        filename = user_path_file if os.path.exists(user_path_file) else legacy_file
+        if os.path.exists(filename):
+            with open(filename) as f:
+                paths = json.load(f)
+        else:
+            paths = {}
+        if not update(paths):
+            return True
+        with open(user_path_file, 'w') as f:
+            json.dump(paths, f, indent=1)
+        if os.path.exists(legacy_file):
+            os.remove(legacy_file)
     return True
 
 
-def resolve_pending_paths(user, **kwargs):
+def _write_accesses(batch, **kwargs):
+    """Writes a batch of accesses into the user path files. Returns the accesses
+    for users whose path files could not be updated.
+    """
+    if 'timeout' not in kwargs:
+        kwargs['timeout'] = 10.0
+    failed = {}
+    for user, accesses in batch.items():
+        if not os.path.exists(_user_path_file(user)) and \
+                not os.path.exists(_legacy_user_path_file(user)):
+            continue  # the user's paths are gone, there is nothing to update
+        def update(paths):
+            changed = False
+            for path, (last, count, tables) in accesses.items():
+                info = paths.get(path, None)
+                if info is None:
+                    continue
+                info['accessed'] = max(info.get('accessed', None) or last, last)
+                info['accesses'] = info.get('accesses', 0) + count
+                if tables:
+                    queried = info.setdefault('tables', {})
+                    for name, n in tables.items():
+                        queried[name] = queried.get(name, 0) + n
+                changed = True
+            return changed
+        if not _update_user_paths(user, update, **kwargs):
+            failed[user] = accesses
+    return failed
+
+
+ACCESS_LOG = AccessLog(_write_accesses, interval=60.0)
+
+
+def _path_size(info):
+    """The number of bytes held by a path, as recorded in its info."""
+    return int(info.get('size', 0))
+
+
+def _background_executor():
+    """Returns the background executor that deduplicates and converts outputs.
+    It has a single worker, so that outputs are converted after they have been
+    deduplicated. It is created on first use.
+    """
+    global _BACKGROUND_EXECUTOR
+    if _BACKGROUND_EXECUTOR is None:
+        _BACKGROUND_EXECUTOR = ThreadPoolExecutor(max_workers=1)
+    return _BACKGROUND_EXECUTOR
+
+
+def _dedup_path(user, path, filename):
+    """Deduplicates the file of a path into the content-addressed store and
+    records its content hash in the path info.
+    """
+    try:
+        d = dedup_file(filename)
+    except OSError:
+        return  # e.g. the store is on another filesystem, or the file is gone
+    _forget_stat(filename)
+
+    def update(paths):
+        info = paths.get(path, None)
+        if info is None or info.get('file', None) != filename:
+            return False
+        info['digest'] = d
+        return True
+
+    _update_user_paths(user, update, timeout=10.0)
+
+
+def resolve_pending_paths(user, dedup=None, **kwargs):
     """This function searches for any pending path files for a user and then adds
-    their information into the users path file (``$FIXIE_PATHS_DIR/user.json``).
-    This will return the contents of the paths file
-    after the update. Pending path files must be names to match the glob:
-    ``$FIXIE_PATHS_DIR/username*-pending-path.json``. Additional keyword arguments
-    are passed into ``fixie.flock()``. Returns None if the user paths file could
-    not be loaded.
-    """
-    pattern = '{0}/{1}*-pending-path.json'.format(ENV['FIXIE_PATHS_DIR'], user)
-    files = glob.glob(pattern)
+    their information into the users path file
+    (``$FIXIE_PATHS_DIR/username/paths.json``). This will return the contents
+    of the paths file after the update. Pending path files must be JSON files in
+    ``$FIXIE_PATHS_DIR/username/pending/``. For compatibility, pending path files
+    in the old flat layout, ``$FIXIE_PATHS_DIR/username-*-pending-path.json``,
+    are also read. If dedup is true (default ``DEDUP_OUTPUTS``), the files of new
+    paths are deduplicated into a content-addressed store in the background.
+    If ``COLUMNAR_AFTER_RESOLVE`` is true, columnar sidecars of the files of new
+    paths are written in the background.
+    Additional keyword arguments are passed into ``fixie.flock()``.
+    Returns None if the user paths file could not be loaded.
+    """
+    files = _pending_files(user)
     if len(files) == 0:
         return _load_user_paths(user, **kwargs)
-    # actually have pending files, lets read them in, update them, add them to the
-    # existing the paths file, and then delete the pending files.
+    # actually have pending files, so read them in and add them to the paths
+    # file, then delete the pending files, all under the lock of the paths file
     new_paths = {}
-    for fname in files:
-        with open(fname) as f:
-            new_path = json.load(f)
-        # need to add created time of file
-        new_path['holding'] = float(new_path['holding'])
-        new_path['created'] = os.stat(new_path['file']).st_ctime
-        new_paths[new_path['path']] = new_path
-    paths = _load_user_paths(user, **kwargs)
-    if paths is None:
+    resolved = []
+    result = {}
+    delta = 0
+
+    def update(paths):
+        nonlocal delta
+        for fname in files:
+            try:
+                with open(fname) as f:
+                    new_path = json.load(f)
+            except FileNotFoundError:
+                continue  # resolved by another thread or process
+            if new_path.get('user', user) != user:
+                # old flat layout file for another user whose name shares a prefix
+                continue
+            # need to add created time of file
+            new_path['holding'] = float(new_path['holding'])
+            st = os.stat(new_path['file'])
+            STAT_CACHE[new_path['file']] = st
+            new_path['created'] = st.st_ctime
+            new_path['size'] = st.st_size
+            old = paths.get(new_path['path'], None)
+            delta += st.st_size - (0 if old is None else _path_size(old))
+            paths[new_path['path']] = new_paths[new_path['path']] = new_path
+            resolved.append(fname)
+        # the paths file is written right after, while still locked, so no
+        # other resolve may read these pending files again
+        for fname in resolved:
+            try:
+                os.remove(fname)
+            except FileNotFoundError:
+                pass
+        for path, info in paths.items():
+            info = result[path] = dict(info)
+            info['holding'] = float(info.get('holding', 'inf'))
+        return len(new_paths) > 0
+
+    if not _update_user_paths(user, update, **kwargs):
         return None
-    paths.update(new_paths)
-    _dump_user_paths(user, paths, **kwargs)
-    for fname in files:
-        os.remove(fname)
-    return paths
+    if delta:
+        update_usage({user: delta}, **kwargs)
+    if DEDUP_OUTPUTS if dedup is None else dedup:
+        executor = _background_executor()
+        for path, info in new_paths.items():
+            executor.submit(_dedup_path, user, path, info['file'])
+    if COLUMNAR_AFTER_RESOLVE:
+        for info in new_paths.values():
+            _submit_conversion(info['file'])
+    return result
 
 
 def listpaths(user, token, pattern=None, **kwargs):
@@ -119,7 +485,7 @@ def listpaths(user, token, pattern=None, **kwargs):
     message : str
         Status message, if needed.
     """
-    valid, msg, status = verify_user(user, token)
+    valid, msg, status = _verify_user(user, token)
     if not status:
         return None, False, msg
     # load the user file
@@ -161,7 +527,12 @@ def info(user, token, paths=None, pattern=None, **kwargs):
     Returns
     -------
     infos : list of dicts or None
-        Path infomation dicts. None if status is False.
+        Path infomation dicts. None if status is False. These include the
+        'accessed' time and number of 'accesses' of each path, which count
+        calls to ``fetch()`` and ``table()``. Calls to ``info()`` itself are
+        not counted, so that listing paths does not make them look recently
+        used to ``gc()``. Once written back, the number of times each table
+        was queried is in 'tables'.
     status : bool
         Whether the paths were correctly found.
     message : str
@@ -169,7 +540,7 @@ def info(user, token, paths=None, pattern=None, **kwargs):
     """
     if paths and pattern:
         return None, False, 'Only one of paths and patterns may be non-empty'
-    valid, msg, status = verify_user(user, token)
+    valid, msg, status = _verify_user(user, token)
     if not status:
         return None, False, msg
     # load the user file
@@ -191,19 +562,25 @@ def info(user, token, paths=None, pattern=None, **kwargs):
     else:
         infos = list(userpaths.values())
         infos.sort(key=_pathkey)
+    infos = [ACCESS_LOG.merge(user, i) for i in infos]
+    for i in infos:
+        i.setdefault('tier', tiers.TIER_WARM)
     return infos, True, 'Info found'
 
 
-def _fetch_url(filename):
+def _fetch_url(filename, codec=None):
     # first, get the pathname relative to the simulation dir
     relname = os.path.relpath(filename, ENV['FIXIE_SIMS_DIR'])
-    url = '/fetch?' + urllib.parse.urlencode({'file': relname})
+    query = {'file': relname}
+    if codec is not None:
+        query['codec'] = codec
+    url = '/fetch?' + urllib.parse.urlencode(query)
     return url, ''
 
 
-def _fetch_bytes(filename):
+def _fetch_bytes(filename, codec=None):
     try:
-        with open(filename, 'rb') as f:
+        with tiers.open_cold(filename, codec) as f:
             b = f.read()
         msg = ''
     except Exception as e:
@@ -212,11 +589,31 @@ def _fetch_bytes(filename):
     return b, msg
 
 
+def _stored_file(info):
+    """The file that holds the contents of a path, which is its cold copy if
+    the path is in the cold tier.
+    """
+    if info.get('tier', tiers.TIER_WARM) == tiers.TIER_COLD:
+        return info.get('cold_file', None)
+    return info.get('file', None)
+
+
+def _local_file(info):
+    """A local, uncompressed file with the contents of a path, which may be
+    queried as a Cyclus database. Paths in the cold tier are rehydrated into
+    the scratch directory.
+    """
+    if info.get('tier', tiers.TIER_WARM) != tiers.TIER_COLD:
+        return info['file']
+    _, ext = os.path.splitext(info['file'])
+    return tiers.rehydrate(info['cold_file'], info.get('codec', None), ext=ext)
+
+
 def _ensure_file(path, user, token, **kwargs):
-    """Ensures that a path actually exist, returns the filename, the
-    user paths, a status flag, and a message.
+    """Ensures that a path actually exist, returns the filename that holds its
+    contents, the user paths, a status flag, and a message.
     """
-    valid, msg, status = verify_user(user, token)
+    valid, msg, status = _verify_user(user, token)
     if not valid or not status:
         return None, None, False, msg
     # load the user file
@@ -227,10 +624,10 @@ def _ensure_file(path, user, token, **kwargs):
     info = userpaths.get(path, None)
     if info is None:
         return None, None, False, 'Path {0!r} does not exist'.format(path)
-    filename = info.get('file', None)
+    filename = _stored_file(info)
     if not filename:
         return None, None, False, 'Path {0!r} does not not have a file'.format(path)
-    if not os.path.isfile(filename):
+    if not _isfile(filename):
         msg = 'Path file {0!r} does not exist or is a directory'.format(filename)
         return None, None, False, msg
     return filename, userpaths, True, ''
@@ -257,7 +654,8 @@ def fetch(path, user, token, url=True, **kwargs):
     -------
     url_or_file : str, bytes, or None
         URL (relative to the server base) where the file may be downloaded (via GET),
-        or the bytes of the file, or None if the status is False/
+        or the bytes of the file, or None if the status is False. Files in the
+        cold tier are decompressed as they are downloaded or read.
     status : bool
         Whether the path can be fetched.
     message : str
@@ -266,8 +664,9 @@ def fetch(path, user, token, url=True, **kwargs):
     filename, userpaths, status, msg = _ensure_file(path, user, token, **kwargs)
     if not status:
         return None, False, msg
+    ACCESS_LOG.record(user, path)
     fetcher = _fetch_url if url else _fetch_bytes
-    url_or_file, msg = fetcher(filename)
+    url_or_file, msg = fetcher(filename, codec=userpaths[path].get('codec', None))
     if url_or_file is None:
         return None, False, msg
     return url_or_file, True, 'File fetched'
@@ -298,19 +697,175 @@ def delete(path, user, token, **kwargs):
     if not status:
         return False, msg
     # actually try to remove the file
-    try:
-        os.remove(filename)
-    except Exception as e:
-        return False, str(e) + '\n\n' + 'Could not remove path ' + path
-    del userpaths[path]
-    status = _dump_user_paths(user, userpaths, **kwargs)
+    status, msg = _remove_file(filename)
     if not status:
+        return False, msg + '\n\n' + 'Could not remove path ' + path
+    popped = _pop_removed_paths(user, {path: filename}, **kwargs)
+    if popped is None:
         msg = ('Removed file {0!r} but could not remove path entry {1!r}, '
                'system is in inconsistent state.')
         return False, msg.format(filename, path)
+    update_usage({user: -sum(map(_path_size, popped))}, **kwargs)
     return True, 'File removed'
 
 
+def _pop_removed_paths(user, removed, **kwargs):
+    """Removes the entries of paths whose files have been removed from a user
+    paths file. This reads, modifies, and writes the file under its lock, so
+    that paths resolved and accesses written in the meantime are kept. Entries
+    that no longer point at the removed file are left alone. Returns the list
+    of removed path infos, or None if the paths file could not be updated.
+    """
+    popped = []
+
+    def update(paths):
+        for path, filename in removed.items():
+            info = paths.get(path, None)
+            if info is not None and _stored_file(info) == filename:
+                popped.append(paths.pop(path))
+        return len(popped) > 0
+
+    if not _update_user_paths(user, update, **kwargs):
+        return None
+    return popped
+
+
+def _remove_sidecars(filename):
+    """Removes any sidecar files and directories that the service has written
+    for a file.
+    """
+    for suffix in _SIDECAR_SUFFIXES:
+        sidecar = filename + suffix
+        try:
+            if os.path.isdir(sidecar):
+                shutil.rmtree(sidecar)
+            else:
+                os.remove(sidecar)
+        except OSError:
+            pass
+
+
+def _remove_file(filename):
+    """Removes a file and its sidecars, returning a status flag and a message."""
+    try:
+        os.remove(filename)
+    except Exception as e:
+        return False, str(e)
+    finally:
+        _forget_stat(filename)
+        sqlite.POOL.close(filename)
+    _remove_sidecars(filename)
+    return True, ''
+
+
+def _select_paths(userpaths, paths=None, pattern=None, older_than=None):
+    """Selects the paths in a user paths dict that match the given selectors.
+    Returns the list of selected paths, paths that were asked for but do not
+    exist, and an error message (empty if the selectors were valid).
+    """
+    if paths:
+        if isinstance(paths, str):
+            paths = [paths]
+        missing = [path for path in paths if path not in userpaths]
+        selected = [path for path in paths if path in userpaths]
+    else:
+        missing = []
+        selected = sorted(userpaths.keys())
+    if pattern:
+        try:
+            r = re.compile(fnmatch.translate(pattern))
+        except Exception:
+            return None, None, 'Could not compile path pattern'
+        selected = [p for p in selected if r.match(p) is not None]
+    if older_than is not None:
+        now = time.time()
+        selected = [p for p in selected
+                    if now - userpaths[p].get('created', now) >= older_than]
+    return selected, missing, ''
+
+
+def delete_many(user, token, paths=None, pattern=None, older_than=None, **kwargs):
+    """Removes many paths (and their files) from the server at once. The user
+    paths file is resolved once, the files are removed concurrently, and the
+    path entries are committed with a single update of the user paths file.
+
+    Parameters
+    ----------
+    user : str
+        Name of user to remove paths for.
+    token : str
+        Token for a user.
+    paths : str or list of str or None, optional
+        Specific paths to remove. If non-empty, pattern must be empty.
+    pattern : str or None, optional
+        Glob string to match paths to remove. If non-empty, paths must be empty.
+    older_than : float or None, optional
+        Only remove paths that were created at least this many seconds ago.
+    kwargs : other key words
+        Passed into ``fixie.flock()`` when loading user paths file.
+
+    Returns
+    -------
+    results : dict or None
+        Maps each selected path to a ``(status, message)`` pair. None if the
+        paths could not be selected.
+    status : bool
+        Whether all of the selected paths were removed.
+    message : str
+        Status message, if needed.
+    """
+    if paths and pattern:
+        return None, False, 'Only one of paths and patterns may be non-empty'
+    if not paths and not pattern and older_than is None:
+        return None, False, 'At least one of paths, pattern, or older_than is required'
+    valid, msg, status = _verify_user(user, token)
+    if not valid or not status:
+        return None, False, msg
+    # load the user file
+    userpaths = resolve_pending_paths(user, **kwargs)
+    if userpaths is None:
+        return None, False, 'User paths file could not be loaded.'
+    selected, missing, msg = _select_paths(userpaths, paths=paths, pattern=pattern,
+                                           older_than=older_than)
+    if selected is None:
+        return None, False, msg
+    results = {path: (False, 'Path {0!r} does not exist'.format(path))
+               for path in missing}
+    # find the files that may actually be removed
+    filenames = {}
+    for path in selected:
+        filename = _stored_file(userpaths[path])
+        if not filename:
+            results[path] = (False, 'Path {0!r} does not not have a file'.format(path))
+        elif not _isfile(filename):
+            msg = 'Path file {0!r} does not exist or is a directory'.format(filename)
+            results[path] = (False, msg)
+        else:
+            filenames[path] = filename
+    # remove the files concurrently
+    removed = {}
+    if filenames:
+        with ThreadPoolExecutor(max_workers=DELETE_WORKERS) as executor:
+            statuses = executor.map(_remove_file, filenames.values())
+            for path, (removed_status, msg) in zip(filenames.keys(), statuses):
+                if removed_status:
+                    removed[path] = filenames[path]
+                    results[path] = (True, 'File removed')
+                else:
+                    results[path] = (False, msg + '\n\n' + 'Could not remove path ' + path)
+    # commit the path entries
+    if removed:
+        popped = _pop_removed_paths(user, removed, **kwargs)
+        if popped is None:
+            msg = ('Removed files for {0} paths but could not remove the path '
+                   'entries, system is in inconsistent state.')
+            return results, False, msg.format(len(removed))
+        update_usage({user: -sum(map(_path_size, popped))}, **kwargs)
+    status = all(s for s, _ in results.values())
+    msg = 'Files removed' if status else 'Some paths could not be removed'
+    return results, status, msg
+
+
 def _open_db(filename):
     """Opens a Cyclus databse."""
     db = None
@@ -331,9 +886,129 @@ def _open_db(filename):
     return db, msg
 
 
-def table(name, path, user, token, conds=None, format='dataframe', orient='columns',
-          **kwargs):
+def _query_table(filename, name, conds=None, columns=None):
+    """Queries a table from a Cyclus database. The columnar sidecar of the
+    database is read if it is up to date. Otherwise SQLite databases are queried
+    directly when the table allows it, and the Cyclus backend is used for the
+    rest. Returns the table and a message.
+    """
+    try:
+        tbl = columnar.query(filename, name, conds=conds, columns=columns)
+    except Exception:
+        tbl = None  # fall back to the database itself
+    if tbl is not None:
+        return tbl, ''
+    _, ext = os.path.splitext(filename)
+    if ext == '.sqlite':
+        try:
+            tbl = sqlite.query(filename, name, conds=conds, columns=columns)
+        except Exception as e:
+            return None, str(e) + '\n\nTable could not be loaded from database'
+        if tbl is not None:
+            return tbl, ''
+    db, msg = _open_db(filename)
+    if db is None:
+        return None, msg
+    try:
+        with db:
+            tbl = db.query(name, conds=conds)
+        if columns:
+            tbl = tbl[list(columns)]
+    except Exception as e:
+        return None, str(e) + '\n\nTable could not be loaded from database'
+    return tbl, ''
+
+
+def _convert_path(filename):
+    """Writes the columnar sidecar of a Cyclus database, from all of its tables."""
+    try:
+        index, msg = _load_schema(filename)
+        if index is None:
+            return
+
+        def tables():
+            for name in index['tables']:
+                tbl, _ = _query_table(filename, name)
+                if tbl is not None:
+                    yield name, tbl
+
+        columnar.write(filename, tables())
+    except Exception:
+        pass  # the sidecar is only an optimization
+    finally:
+        _CONVERTING.discard(filename)
+
+
+def _submit_conversion(filename):
+    """Converts a Cyclus database into a columnar sidecar in the background, if
+    it is not already being converted and pyarrow is available.
+    """
+    if filename in _CONVERTING or not columnar.available():
+        return
+    _CONVERTING.add(filename)
+    _background_executor().submit(_convert_path, filename)
+
+
+def _table_queries(user, info):
+    """The number of table queries of a path, including those that have not
+    been written back yet. Other accesses, such as fetches, are not counted.
+    """
+    queried = dict(info.get('tables', None) or {})
+    pending = ACCESS_LOG.get(user, info['path'])
+    if pending is not None:
+        for name, n in pending[2].items():
+            queried[name] = queried.get(name, 0) + n
+    return sum(queried.values())
+
+
+def _query_cache_dir():
+    """The directory of the query result cache. This is local to the server and
+    private to its user, and must not be anywhere that users may write to or
+    fetch from, such as ``$FIXIE_SIMS_DIR``.
+    """
+    if QUERY_CACHE_DIR is not None:
+        return QUERY_CACHE_DIR
+    cache_home = ENV.get('XDG_CACHE_HOME', None) or \
+                 os.environ.get('XDG_CACHE_HOME', None) or \
+                 os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'fixie-data', 'query')
+
+
+QUERY_CACHE = DiskCache(_query_cache_dir, maxbytes=1 << 30)
+
+
+def _query_key(filename, name, conds, columns, format, orient, downsample=None):
+    """Key for a table query in the query cache, which changes with the
+    contents of the file. Raises OSError if the file does not exist.
+    """
+    st = os.stat(filename)
+    return (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size, name,
+            conds and [list(c) for c in conds], columns and list(columns),
+            format, orient, downsample and sorted(downsample.items()))
+
+
+def _format_table(tbl, format='dataframe', orient='columns'):
+    """Formats a table, returning the formatted table and a message."""
+    if format == 'dataframe':
+        rtn = tbl
+    elif format.startswith('json'):
+        try:
+            rtn = tbl.to_json(orient=orient, default_handler=fixie_json.default)
+        except Exception as e:
+            return None, str(e) + '\n\nCould not format table'
+        if format == "json:dict":
+            rtn = json.loads(rtn)
+    else:
+        return None, 'Table format {0!r} not valid'.format(format)
+    return rtn, ''
+
+
+def table(name, path, user, token, conds=None, columns=None, format='dataframe',
+          orient='columns', downsample=None, **kwargs):
     """Retrieves a table from a path (which must represent a Cyclus database).
+    Results of queries that take at least ``QUERY_CACHE_MIN_TIME`` seconds are
+    held in the on-disk query cache, which is shared by all server processes.
+    Paths in the cold tier are rehydrated into the scratch directory first.
 
     Parameters
     ----------
@@ -348,7 +1023,10 @@ def table(name, path, user, token, conds=None, format='dataframe', orient='colum
     conds : list of 3-tuples or None, optional
         Conditions to filter table rows with. See the Cyclus FullBackend for
         more information.  The default (None) is to provide the complete
-        table.
+        table. For SQLite databases, the operators 'in' and 'not in' may also
+        be used with a list value, see ``fixie_data.sqlite.compile_conds()``.
+    columns : list of str or None, optional
+        Columns to return. The default (None) is to return all columns.
     format : str, optional
         Flag for type of object to return. If "dataframe" (default), a pandas
         DataFrame will be returned. If "json:dict", a Python dict that
@@ -357,6 +1035,11 @@ def table(name, path, user, token, conds=None, format='dataframe', orient='colum
     orient : str, optional
         Flag for orientation that is passed into ``pandas.DataFrame.to_json()``
         See this method for more documentation.
+    downsample : dict or None, optional
+        Options for downsampling the time series in the table for plotting,
+        which are passed into ``fixie_data.downsample.downsample_table()``.
+        For example, ``{'points': 1000, 'method': 'lttb'}`` keeps about 1000
+        rows per agent. The default (None) is to return every row.
     kwargs : other key words
         Passed into ``fixie.flock()`` when loading user paths file.
 
@@ -373,77 +1056,652 @@ def table(name, path, user, token, conds=None, format='dataframe', orient='colum
     filename, userpaths, status, msg = _ensure_file(path, user, token, **kwargs)
     if not status:
         return None, False, msg
+    ACCESS_LOG.record(user, path, table=name)
+    info = userpaths[path]
+    cold = info.get('tier', tiers.TIER_WARM) == tiers.TIER_COLD
+    if COLUMNAR_AFTER_QUERIES is not None and not cold:
+        queries = _table_queries(user, info)
+        if queries >= COLUMNAR_AFTER_QUERIES and not columnar.is_current(filename):
+            _submit_conversion(filename)
+    key = None
+    if QUERY_CACHE is not None:
+        try:
+            key = _query_key(filename, name, conds, columns, format, orient,
+                             downsample=downsample)
+        except OSError:
+            # the stat cache may not have seen the file being removed yet
+            _forget_stat(filename)
+            msg = 'Path file {0!r} does not exist or is a directory'.format(filename)
+            return None, False, msg
+        rtn = QUERY_CACHE.get(key)
+        if rtn is not None:
+            return rtn, True, 'Table read'
+    t0 = time.monotonic()
+    if cold:
+        try:
+            filename = _local_file(info)
+        except Exception as e:
+            return None, False, str(e) + '\n\nCould not rehydrate ' + filename
+    tbl, msg = _query_table(filename, name, conds=conds, columns=columns)
+    if tbl is None:
+        return None, False, msg
+    if downsample:
+        try:
+            tbl = downsample_table(tbl, **downsample)
+        except (TypeError, ValueError) as e:
+            return None, False, str(e) + '\n\nCould not downsample table'
+    # now that we have the table, format it.
+    rtn, msg = _format_table(tbl, format=format, orient=orient)
+    if rtn is None:
+        return None, False, msg
+    if key is not None and time.monotonic() - t0 >= QUERY_CACHE_MIN_TIME:
+        try:
+            QUERY_CACHE.set(key, rtn)
+        except Exception:
+            pass  # the cache is only an optimization
+    return rtn, True, 'Table read'
+
+
+def _after_fork():
+    """Drops the executors of the parent process in a forked child process.
+    They are created again on first use.
+    """
+    global _COMPARE_EXECUTOR, _BACKGROUND_EXECUTOR
+    _COMPARE_EXECUTOR = None
+    _BACKGROUND_EXECUTOR = None
+    _CONVERTING.clear()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def _compare_executor():
+    """Returns the process pool that compare queries run in. It is created on
+    first use.
+    """
+    global _COMPARE_EXECUTOR
+    if _COMPARE_EXECUTOR is None:
+        from concurrent.futures import ProcessPoolExecutor
+        _COMPARE_EXECUTOR = ProcessPoolExecutor(max_workers=COMPARE_WORKERS)
+    return _COMPARE_EXECUTOR
+
+
+def compare_files(pattern, user, token, **kwargs):
+    """Resolves a glob pattern into the paths and files that ``compare()`` will
+    query. Returns a list of (path, filename) pairs, a status flag, and a message.
+    Paths without an existing file are skipped, and paths in the cold tier are
+    rehydrated.
+    """
+    valid, msg, status = _verify_user(user, token)
+    if not valid or not status:
+        return None, False, msg
+    userpaths = resolve_pending_paths(user, **kwargs)
+    if userpaths is None:
+        return None, False, 'User paths file could not be loaded.'
+    selected, _, msg = _select_paths(userpaths, pattern=pattern)
+    if selected is None:
+        return None, False, msg
+    candidates = {path: _stored_file(userpaths[path]) for path in selected}
+    existing = _existing_files(f for f in candidates.values() if f)
+    files = []
+    for path, f in candidates.items():
+        if f not in existing:
+            continue
+        try:
+            files.append((path, _local_file(userpaths[path])))
+        except Exception:
+            continue  # a cold file that could not be rehydrated
+    return files, True, ''
+
+
+def iter_compare(files, name, conds=None, columns=None):
+    """Queries the same table from many files across a process pool. Yields
+    (path, table, message) triples in the order of the files, as they become
+    available. The table is None if it could not be loaded.
+    """
+    executor = _compare_executor()
+    futures = [executor.submit(_query_table, filename, name, conds=conds,
+                               columns=columns)
+               for _, filename in files]
+    for (path, _), future in zip(files, futures):
+        try:
+            tbl, msg = future.result()
+        except Exception as e:
+            tbl, msg = None, str(e) + '\n\nTable could not be loaded from database'
+        if tbl is not None:
+            tbl.insert(0, 'path', path)
+        yield path, tbl, msg
+
+
+def compare(name, pattern, user, token, conds=None, columns=None, format='dataframe',
+            orient='columns', **kwargs):
+    """Retrieves the same table from many paths (which must represent Cyclus
+    databases) and concatenates the results. The queries are run concurrently
+    across a process pool.
+
+    Parameters
+    ----------
+    name : str
+        Name of table to retrieve.
+    pattern : str
+        Glob string to match paths, as in ``info()``.
+    user : str
+        Name of user to retrieve tables for.
+    token : str
+        Token for a user.
+    conds : list of 3-tuples or None, optional
+        Conditions to filter table rows with, as in ``table()``.
+    columns : list of str or None, optional
+        Columns to return. The default (None) is to return all columns.
+    format : str, optional
+        Flag for type of object to return, as in ``table()``.
+    orient : str, optional
+        Flag for orientation, as in ``table()``.
+    kwargs : other key words
+        Passed into ``fixie.flock()`` when loading user paths file.
+
+    Returns
+    -------
+    table : pandas.DataFrame or dict str or None
+        The concatenated tables, with an additional leading 'path' column that
+        labels which path each row came from. None if no table could be loaded.
+    status : bool
+        Whether the tables could be loaded.
+    message : str
+        Status message, if needed. Lists the paths whose tables could not
+        be loaded.
+    """
+    files, status, msg = compare_files(pattern, user, token, **kwargs)
+    if not status:
+        return None, False, msg
+    if len(files) == 0:
+        return None, False, 'No paths matched pattern {0!r}'.format(pattern)
+    tbls = []
+    failed = []
+    for path, tbl, msg in iter_compare(files, name, conds=conds, columns=columns):
+        if tbl is None:
+            failed.append(path)
+        else:
+            tbls.append(tbl)
+    if len(tbls) == 0:
+        return None, False, 'Table could not be loaded from any path'
+    tbl = pd.concat(tbls, ignore_index=True)
+    rtn, msg = _format_table(tbl, format=format, orient=orient)
+    if rtn is None:
+        return None, False, msg
+    msg = 'Tables compared'
+    if failed:
+        msg += ', could not load table for paths: ' + ', '.join(failed)
+    return rtn, True, msg
+
+
+def _schema_file(filename):
+    """The schema index file for a Cyclus database."""
+    return filename + '.schema.json'
+
+
+def _build_schema(filename):
+    """Builds the schema index for a Cyclus database, which contains the names,
+    column names and types, and row counts of all of its tables. SQLite
+    databases are indexed from their metadata, while the tables of other
+    databases must be read in full. Returns the index and a message.
+    """
+    if filename.endswith('.sqlite'):
+        try:
+            return {'tables': sqlite.schema(filename)}, ''
+        except Exception:
+            pass  # not readable directly, fall back to the Cyclus backend
     db, msg = _open_db(filename)
     if db is None:
-        return None, False, msg
+        return None, msg
+    tables = {}
     try:
         with db:
-            tbl = db.query(name, conds=conds)
+            for name in sorted(db.tables):
+                try:
+                    tbl = db.query(name)
+                except Exception:
+                    tables[name] = {'columns': [], 'rows': None}
+                    continue
+                columns = [{'name': col, 'type': str(dtype)}
+                           for col, dtype in tbl.dtypes.items()]
+                tables[name] = {'columns': columns, 'rows': len(tbl)}
     except Exception as e:
-        return None, False, str(e) + '\n\nTable could not be loaded from database'
-    # now that we have the table, format it.
-    if format == 'dataframe':
-        rtn = tbl
-    elif format.startswith('json'):
+        return None, str(e) + '\n\nCould not read database schema'
+    return {'tables': tables}, ''
+
+
+def _load_schema(filename):
+    """Loads the schema index for a Cyclus database, building and storing it
+    next to the database if it does not exist or is out of date. The index is
+    valid for a given (file, mtime) pair, and is shared in memory between
+    deduplicated copies of the same file. Returns the index and a message.
+    """
+    st = _stat(filename)
+    if st is None:
+        return None, 'Path file {0!r} does not exist'.format(filename)
+    key = _file_identity(st)
+    index = SCHEMA_CACHE.get(key)
+    if index is not None:
+        return index, ''
+    schema_file = _schema_file(filename)
+    try:
+        with open(schema_file) as f:
+            index = json.load(f)
+    except Exception:
+        index = None
+    if index is None or index.get('mtime_ns', None) != st.st_mtime_ns:
+        index, msg = _build_schema(filename)
+        if index is None:
+            return None, msg
+        index['mtime_ns'] = st.st_mtime_ns
+        tmp = schema_file + '.tmp'
         try:
-            rtn = tbl.to_json(orient=orient, default_handler=json.default)
-        except Exception as e:
-            return None, False, str(e) + '\n\nCould not format table'
-        if format == "json:dict":
-            rtn = json.loads(rtn)
-    else:
-        return None, False, 'Table format {0!r} not valid'.format(format)
-    return rtn, True, 'Table read'
+            with open(tmp, 'w') as f:
+                json.dump(index, f, indent=1)
+            os.replace(tmp, schema_file)
+        except Exception:
+            pass  # the index may still be served from memory
+    SCHEMA_CACHE[key] = index
+    return index, ''
 
 
-def gc(**kwargs):
-    """Cleans up paths & files that have past their holding time.
+def _schema_indexed(filename):
+    """Whether the schema index of a Cyclus database is already built and up to
+    date, so that loading it is cheap. Valid indexes found on disk are held in
+    memory for the following load.
+    """
+    st = _stat(filename)
+    if st is None:
+        return False
+    key = _file_identity(st)
+    if key in SCHEMA_CACHE:
+        return True
+    try:
+        with open(_schema_file(filename)) as f:
+            index = json.load(f)
+    except Exception:
+        return False
+    if index.get('mtime_ns', None) != st.st_mtime_ns:
+        return False
+    SCHEMA_CACHE[key] = index
+    return True
+
+
+def is_schema_indexed(path, user, token, **kwargs):
+    """Whether the schema of a path may be served from an index that has already
+    been built, without reading the database. Paths in the cold tier are
+    never considered indexed, since they may need to be rehydrated first.
 
     Parameters
     ----------
+    path : str
+        Path to check.
+    user : str
+        Name of user that the path belongs to.
+    token : str
+        Token for a user.
     kwargs : other key words
         Passed into ``fixie.flock()`` when loading user paths file.
 
     Returns
     -------
+    indexed : bool
+        Whether the schema index is built and up to date. False if the path
+        could not be found.
+    """
+    filename, userpaths, status, msg = _ensure_file(path, user, token, **kwargs)
+    if not status:
+        return False
+    if userpaths[path].get('tier', tiers.TIER_WARM) == tiers.TIER_COLD:
+        return False  # may need to be rehydrated
+    return _schema_indexed(filename)
+
+
+def schema(path, user, token, **kwargs):
+    """Retrieves the schema of a path (which must represent a Cyclus database).
+    This is served from an index that is built once per file modification,
+    and so is cheap to call repeatedly.
+
+    Parameters
+    ----------
+    path : str
+        Path to get the schema of.
+    user : str
+        Name of user to get the schema for.
+    token : str
+        Token for a user.
+    kwargs : other key words
+        Passed into ``fixie.flock()`` when loading user paths file.
+
+    Returns
+    -------
+    schema : dict or None
+        Maps table names to dicts with 'columns' (a list of dicts with 'name'
+        and 'type' keys) and 'rows' (the number of rows in the table).
+        None if the schema could not be loaded.
     status : bool
-        Whether garbage collection completed.
+        Whether the schema could be loaded.
     message : str
         Status message, if needed.
     """
-    if 'raise_errors' not in kwargs:
-        kwargs['raise_errors'] = False
+    filename, userpaths, status, msg = _ensure_file(path, user, token, **kwargs)
+    if not status:
+        return None, False, msg
+    try:
+        filename = _local_file(userpaths[path])
+    except Exception as e:
+        return None, False, str(e) + '\n\nCould not rehydrate ' + filename
+    index, msg = _load_schema(filename)
+    if index is None:
+        return None, False, msg
+    return index['tables'], True, 'Schema read'
+
+
+def _user_path_files():
+    """Returns all user path files, in both the sharded and the old flat layouts.
+    Old flat layout files are only returned for users that have not yet been
+    moved to the sharded layout.
+    """
+    paths_dir = ENV['FIXIE_PATHS_DIR']
+    files = []
+    try:
+        names = sorted(os.listdir(paths_dir))
+    except OSError:
+        return files
+    for name in names:
+        if name.startswith('.'):
+            continue
+        sharded = _USER_PATH_FILE_TEMPLATE.format(paths_dir, name)
+        if os.path.isfile(sharded):
+            files.append(sharded)
+        elif name.endswith('.json') and not name.endswith(_LEGACY_PENDING_SUFFIX):
+            user = name[:-5]
+            if not os.path.isfile(_USER_PATH_FILE_TEMPLATE.format(paths_dir, user)):
+                files.append(os.path.join(paths_dir, name))
+    return files
+
+
+def _path_file_user(user_path_file):
+    """Returns the user that a user path file belongs to."""
+    if os.path.basename(user_path_file) == 'paths.json':
+        return os.path.basename(os.path.dirname(user_path_file))
+    return os.path.basename(user_path_file)[:-5]
+
+
+def _record_sizes(paths):
+    """Records the sizes of the paths in a user paths dict that do not yet have
+    one, such as those resolved before sizes were recorded, by measuring their
+    files. Returns whether any sizes were recorded.
+    """
+    changed = False
+    for info in paths.values():
+        if 'size' in info:
+            continue
+        filename = _stored_file(info)
+        st = _stat(filename) if filename else None
+        if st is None:
+            continue
+        info['size'] = st.st_size
+        changed = True
+    return changed
+
+
+def _rebuild_usage(**kwargs):
+    """Rebuilds the usage file from the sizes recorded in all of the user path
+    files, and returns the per user usage. Paths without a recorded size have
+    their files measured, and their sizes are recorded in the user path files.
+    """
+    users = {}
+    for user_path_file in _user_path_files():
+        user = _path_file_user(user_path_file)
+        totals = []
+
+        def update(paths):
+            changed = _record_sizes(paths)
+            totals.append(sum(_path_size(info) for info in paths.values()))
+            return changed
+
+        try:
+            _update_user_paths(user, update, **kwargs)
+            if not totals:
+                # the file is locked, so only count the recorded sizes
+                with open(user_path_file) as f:
+                    paths = json.load(f)
+                totals.append(sum(_path_size(info) for info in paths.values()))
+        except Exception:
+            continue
+        users[user] = totals[0]
+    dump_usage(users, **kwargs)
+    return users
+
+
+def usage(user, token, **kwargs):
+    """Retrieves the number of bytes held by the outputs of a user, and in total.
+    This is served from incrementally maintained accounting, and so does not
+    walk the filesystem.
+
+    Parameters
+    ----------
+    user : str
+        Name of user to get the usage of.
+    token : str
+        Token for a user.
+    kwargs : other key words
+        Passed into ``fixie.flock()`` when loading the usage file.
+
+    Returns
+    -------
+    usage : dict or None
+        Has 'user' and 'total' keys, with the number of bytes held by the user
+        and by all users. None if the usage could not be loaded.
+    status : bool
+        Whether the usage could be loaded.
+    message : str
+        Status message, if needed.
+    """
+    valid, msg, status = _verify_user(user, token)
+    if not valid or not status:
+        return None, False, msg
+    users = load_usage(**kwargs)
+    if users is None:
+        users = _rebuild_usage(**kwargs)
+    rtn = {'user': users.get(user, 0), 'total': sum(users.values())}
+    return rtn, True, 'Usage found'
+
+
+def _gc_user_path_file(user_path_file, select, **kwargs):
+    """Removes the paths & files in a user path file that are selected by
+    ``select(paths)``, which must return the selected paths. Returns the number
+    of bytes removed and a message. The file is locked like any other update
+    of the user's paths, whichever layout it is in, for the whole gc process.
+    """
+    user = _path_file_user(user_path_file)
+    msgs = []
+    removed = []
+
+    def update(paths):
+        selected = {path: _stored_file(paths[path]) for path in select(paths)}
+        existing = _existing_files(selected.values())
+        # delete files
+        for path, fname in selected.items():
+            if fname not in existing:
+                continue
+            status, err = _remove_file(fname)
+            if not status:
+                msgs.append(err + '\nCould not delete file ' + fname + '\n\n')
+                continue
+            removed.append(paths.pop(path))
+        return len(removed) > 0
+
+    if not _update_user_paths(user, update, **kwargs):
+        return 0, user_path_file + ' could not be loaded\n\n'
+    return sum(map(_path_size, removed)), ''.join(msgs)
+
+
+def _lru_key(info):
+    """Key for ordering paths from least to most recently used."""
+    return info.get('accessed', info['created'])
+
+
+def _freeze_path(user, path, info, **kwargs):
+    """Moves a path into the cold tier. The cold copy of its file is written
+    first, and the file is only removed once the path entry records the cold
+    copy. Returns the change in the number of bytes held and a message.
+    """
+    filename = info['file']
+    try:
+        cold_file, codec = tiers.freeze(filename)
+    except Exception as e:
+        return 0, str(e) + '\nCould not move file ' + filename + ' to cold storage\n\n'
+    size = os.path.getsize(cold_file)
+    frozen = []
+
+    def update(paths):
+        current = paths.get(path, None)
+        if current is None or current.get('file', None) != filename or \
+                current.get('tier', tiers.TIER_WARM) != tiers.TIER_WARM:
+            return False
+        current.update(tier=tiers.TIER_COLD, cold_file=cold_file, codec=codec,
+                       size=size)
+        frozen.append(path)
+        return True
+
+    if not _update_user_paths(user, update, **kwargs) or not frozen:
+        # the path changed in the meantime, so the cold copy is not needed
+        os.remove(cold_file)
+        return 0, ''
+    status, err = _remove_file(filename)
+    if not status:
+        return 0, err + '\nCould not remove file ' + filename + ' after moving it to cold storage\n\n'
+    return size - _path_size(info), ''
+
+
+def _freeze_idle(now, cold_after, **kwargs):
+    """Moves the warm paths that have not been accessed for cold_after seconds
+    into the cold tier. Returns a dict mapping users to changes in the number
+    of bytes held, and a message.
+    """
+    ACCESS_LOG.flush()
+    deltas = {}
     msg = ''
-    now = time.time()
-    pattern = ENV['FIXIE_PATHS_DIR'] + '/*.json'
-    for user_path_file in glob.iglob(pattern):
-        if user_path_file.endswith('-pending-path.json'):
+    for user_path_file in _user_path_files():
+        try:
+            with open(user_path_file) as f:
+                paths = json.load(f)
+        except Exception:
             continue
-        with flock(user_path_file, **kwargs) as lockfd:
-            # need to keep file locked for whole gc process
-            if lockfd == 0:
-                msg += user_path_file + ' could not be loaded\n\n'
+        user = _path_file_user(user_path_file)
+        for path, info in sorted(paths.items()):
+            if info.get('tier', tiers.TIER_WARM) != tiers.TIER_WARM or \
+                    now - _lru_key(info) < cold_after or \
+                    not _isfile(info.get('file', None) or ''):
                 continue
+            delta, err = _freeze_path(user, path, info, **kwargs)
+            msg += err
+            deltas[user] = deltas.get(user, 0) + delta
+    return deltas, msg
+
+
+def _plan_eviction(now, max_bytes=None, max_user_bytes=None, min_holding=0.0,
+                   **kwargs):
+    """Plans which paths to evict, least recently used first, to bring the total
+    and per user usage below their limits. Paths younger than min_holding are
+    never evicted. Returns a dict mapping user path files to sets of paths.
+    """
+    ACCESS_LOG.flush()
+    users = load_usage(**kwargs)
+    if users is None:
+        users = _rebuild_usage(**kwargs)
+    total = sum(users.values())
+    candidates = []
+    for user_path_file in _user_path_files():
+        try:
             with open(user_path_file) as f:
                 paths = json.load(f)
-            # delete files
-            paths_to_del = set()
-            for path, info in paths.items():
-                age = now - info['created']
-                holding = float(info.get('holding', 'inf'))
-                fname = info['file']
-                if age >= holding and os.path.isfile(fname):
-                    try:
-                        os.remove(fname)
-                    except Exception as e:
-                        msg += str(e) + '\nCould not delete file ' + fname + '\n\n'
-                        continue
-                    paths_to_del.add(path)
-            # delete paths
-            if len(paths_to_del) == 0:
+        except Exception:
+            continue
+        user = _path_file_user(user_path_file)
+        for path, info in paths.items():
+            if now - info['created'] < min_holding:
                 continue
-            for path in paths_to_del:
-                del paths[path]
-            with open(user_path_file, 'w') as f:
-                json.dump(paths, f, indent=1)
+            candidates.append((_lru_key(info), user_path_file, user, path,
+                               _path_size(info)))
+    candidates.sort()
+    plan = {}
+    for _, user_path_file, user, path, size in candidates:
+        over_total = max_bytes is not None and total > max_bytes
+        over_user = max_user_bytes is not None and users.get(user, 0) > max_user_bytes
+        if not over_total and not over_user:
+            continue
+        plan.setdefault(user_path_file, set()).add(path)
+        total -= size
+        users[user] = users.get(user, 0) - size
+    return plan
+
+
+def gc(max_bytes=None, max_user_bytes=None, min_holding=0.0, cold_after=None,
+       **kwargs):
+    """Cleans up paths & files that have past their holding time. If cold_after
+    is given, paths that have not been accessed for that long are then moved
+    into the cold tier. If usage limits are given, paths are then also evicted,
+    least recently used first, until usage is below the limits. Finally, files
+    in the content-addressed store that are no longer referenced are removed.
+
+    Parameters
+    ----------
+    max_bytes : int or None, optional
+        Total number of bytes that all outputs may hold.
+    max_user_bytes : int or None, optional
+        Number of bytes that the outputs of each user may hold.
+    min_holding : float, optional
+        Minimum age, in seconds, of paths that may be evicted to meet the
+        usage limits.
+    cold_after : float or None, optional
+        Time since the last access, in seconds, after which paths are moved
+        into the cold tier, see ``fixie_data.tiers``. If None (default), paths
+        are never moved.
+    kwargs : other key words
+        Passed into ``fixie.flock()`` when loading user paths file.
+
+    Returns
+    -------
+    status : bool
+        Whether garbage collection completed.
+    message : str
+        Status message, if needed.
+    """
+    if 'raise_errors' not in kwargs:
+        kwargs['raise_errors'] = False
+    msg = ''
+    now = time.time()
+
+    def expired(paths):
+        return [path for path, info in paths.items()
+                if now - info['created'] >= float(info.get('holding', 'inf'))]
+
+    deltas = {}
+    for user_path_file in _user_path_files():
+        size, err = _gc_user_path_file(user_path_file, expired, **kwargs)
+        msg += err
+        deltas[_path_file_user(user_path_file)] = -size
+    update_usage(deltas, **kwargs)
+    if cold_after is not None:
+        deltas, err = _freeze_idle(now, cold_after, **kwargs)
+        msg += err
+        update_usage(deltas, **kwargs)
+    if max_bytes is None and max_user_bytes is None:
+        msg += prune_store()[1]
+        return not msg, msg
+    # evict paths to meet the usage limits
+    plan = _plan_eviction(now, max_bytes=max_bytes, max_user_bytes=max_user_bytes,
+                          min_holding=min_holding, **kwargs)
+    deltas = {}
+    for user_path_file, planned in plan.items():
+        select = lambda paths: [path for path in planned if path in paths]
+        size, err = _gc_user_path_file(user_path_file, select, **kwargs)
+        msg += err
+        deltas[_path_file_user(user_path_file)] = -size
+    update_usage(deltas, **kwargs)
+    msg += prune_store()[1]
     return not msg, msg
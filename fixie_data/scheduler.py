@@ -0,0 +1,175 @@
+"""Fair-share admission control for the expensive requests of the fixie data
+service. Expensive requests, such as table queries and file downloads, must
+hold one of a bounded number of slots while they run. Requests that wait for
+a slot are queued per user, with a bound on the depth of each queue, and
+slots are handed out in weighted fair order, so that one user issuing many
+requests cannot starve the others. Requests that could not start before their
+deadline are rejected rather than left waiting. Cheap requests never wait on
+the scheduler.
+"""
+import time
+import heapq
+import asyncio
+import weakref
+import contextlib
+
+
+SLOTS = 4  # should be less than fixie_data.aio.AIO_WORKERS, to leave a fast lane
+MAX_QUEUE = 16
+DEADLINE = 30.0
+WEIGHTS = {}
+_SCHEDULERS = weakref.WeakKeyDictionary()
+
+
+class Rejected(Exception):
+    """Raised when a request is not admitted by the scheduler."""
+
+    def __init__(self, message, retry_after=1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class FairScheduler(object):
+    """Schedules expensive requests with weighted fair queuing. Each waiting
+    request is tagged with a virtual finish time, which advances by the cost
+    of the request divided by the weight of its user, and the request with the
+    smallest tag is admitted first.
+    """
+
+    def __init__(self, slots=SLOTS, max_queue=MAX_QUEUE, deadline=DEADLINE,
+                 weights=None, timer=time.monotonic):
+        """
+        Parameters
+        ----------
+        slots : int, optional
+            Number of expensive requests that may run at once.
+        max_queue : int, optional
+            Number of requests that each user may have waiting.
+        deadline : float, optional
+            Default time, in seconds, that a request may wait for a slot.
+        weights : dict or None, optional
+            Maps users to their share weights, default 1.0.
+        timer : callable, optional
+            Function returning the current time, in seconds.
+        """
+        self.slots = slots
+        self.max_queue = max_queue
+        self.deadline = deadline
+        self.weights = WEIGHTS if weights is None else weights
+        self.timer = timer
+        self.running = 0
+        self.admitted = 0
+        self.rejected = {'queue_full': 0, 'deadline': 0}
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.service_time = 0.0  # moving average
+        self._vtime = 0.0
+        self._last_tag = {}
+        self._depth = {}
+        self._heap = []
+        self._seq = 0
+
+    def _expected_wait(self):
+        queued = sum(self._depth.values())
+        return (queued + 1) * self.service_time / max(self.slots, 1)
+
+    def _admit_next(self):
+        while self._heap and self.running < self.slots:
+            tag, _, user, future = heapq.heappop(self._heap)
+            if future.done():
+                continue  # timed out or cancelled while waiting
+            self._depth[user] -= 1
+            self._vtime = tag
+            self.running += 1
+            future.set_result(None)
+
+    async def acquire(self, user, cost=1.0, deadline=None):
+        """Waits for a slot for a request of a user. Raises ``Rejected`` if the
+        user's queue is full, or if the request could not start before its
+        deadline, in seconds.
+        """
+        deadline = self.deadline if deadline is None else deadline
+        t0 = self.timer()
+        self._admit_next()
+        if self.running < self.slots and not self._heap:
+            self.running += 1
+            self._admitted(0.0)
+            return
+        if self._depth.get(user, 0) >= self.max_queue:
+            self.rejected['queue_full'] += 1
+            raise Rejected('Too many requests queued for user {0!r}'.format(user),
+                           retry_after=self._expected_wait())
+        expected = self._expected_wait()
+        if expected > deadline:
+            self.rejected['deadline'] += 1
+            raise Rejected('Server too busy, expected wait of {0:.1f} s exceeds '
+                           'deadline'.format(expected), retry_after=expected)
+        weight = self.weights.get(user, 1.0)
+        tag = max(self._vtime, self._last_tag.get(user, 0.0)) + cost / weight
+        self._last_tag[user] = tag
+        future = asyncio.get_event_loop().create_future()
+        self._seq += 1
+        heapq.heappush(self._heap, (tag, self._seq, user, future))
+        self._depth[user] = self._depth.get(user, 0) + 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), deadline)
+        except asyncio.TimeoutError:
+            if not future.done():
+                self._withdraw(user, future)
+                self.rejected['deadline'] += 1
+                raise Rejected('Request could not start before its deadline',
+                               retry_after=self._expected_wait())
+            # otherwise the slot was granted just as the deadline passed
+        except asyncio.CancelledError:
+            if future.done():
+                self.release()  # the slot was granted just as we were cancelled
+            else:
+                self._withdraw(user, future)
+            raise
+        self._admitted(self.timer() - t0)
+
+    def _withdraw(self, user, future):
+        # the entry stays in the heap, and is skipped once it reaches the top
+        future.cancel()
+        self._depth[user] -= 1
+
+    def _admitted(self, wait):
+        self.admitted += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+
+    def release(self, service_time=None):
+        """Releases a slot, optionally recording how long the request ran."""
+        self.running -= 1
+        if service_time is not None:
+            self.service_time = 0.9 * self.service_time + 0.1 * service_time \
+                                if self.service_time else service_time
+        self._admit_next()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, user, cost=1.0, deadline=None):
+        """Async context manager that holds a slot for a request of a user."""
+        await self.acquire(user, cost=cost, deadline=deadline)
+        t0 = self.timer()
+        try:
+            yield
+        finally:
+            self.release(self.timer() - t0)
+
+    def stats(self):
+        """Returns a dict of scheduler metrics."""
+        depths = {user: n for user, n in self._depth.items() if n > 0}
+        return {'slots': self.slots, 'running': self.running,
+                'queued': sum(depths.values()), 'queue_depths': depths,
+                'admitted': self.admitted, 'rejected': dict(self.rejected),
+                'wait_mean': self.wait_total / self.admitted if self.admitted else 0.0,
+                'wait_max': self.wait_max, 'service_time': self.service_time}
+
+
+def scheduler():
+    """Returns the scheduler for the running event loop."""
+    loop = asyncio.get_event_loop()
+    s = _SCHEDULERS.get(loop, None)
+    if s is None:
+        s = _SCHEDULERS[loop] = FairScheduler()
+    return s
@@ -0,0 +1,65 @@
+"""Pre-fork, multi-process server for the fixie data service. The listening
+sockets are bound once, and then the server forks into one worker process per
+core, which all accept requests on the same sockets. Workers coordinate through
+the same ``flock()``-protected path files as any other process, and share
+parsed path files and slow query results through their caches::
+
+    python -m fixie_data.server --port 8642 --processes 0
+
+Executors, connection pools, and background threads are created lazily after
+the fork, so that each worker has its own. Each worker runs the startup stage
+before it starts serving, and only the first worker warms the caches.
+"""
+import argparse
+
+from tornado import httpserver, ioloop, netutil, process, web
+
+from fixie_data import handlers
+
+
+def make_app(**settings):
+    """Makes the Tornado application for the fixie data handlers."""
+    return web.Application(handlers.HANDLERS, **settings)
+
+
+def serve(port=8642, address=None, processes=0):
+    """Serves the fixie data handlers.
+
+    Parameters
+    ----------
+    port : int, optional
+        Port to listen on.
+    address : str or None, optional
+        Address to listen on, default all interfaces.
+    processes : int, optional
+        Number of worker processes to fork. If zero or less, one worker
+        is forked per core. If one, the server runs in this process.
+    """
+    sockets = netutil.bind_sockets(port, address=address)
+    if processes != 1:
+        process.fork_processes(processes)
+    task_id = process.task_id()
+    if task_id:
+        handlers.WARM_START = False
+    server = httpserver.HTTPServer(make_app())
+    server.add_sockets(sockets)
+    handlers.startup()
+    ioloop.IOLoop.current().start()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Serves the fixie data handlers '
+                                                 'from many processes.')
+    parser.add_argument('--port', type=int, default=8642,
+                        help='port to listen on.')
+    parser.add_argument('--address', default=None,
+                        help='address to listen on, default all interfaces.')
+    parser.add_argument('--processes', type=int, default=0,
+                        help='number of worker processes, one per core if zero.')
+    ns = parser.parse_args(args)
+    serve(port=ns.port, address=ns.address, processes=ns.processes)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,347 @@
+"""Direct queries of Cyclus SQLite output files. Conditions are compiled into
+parameterized SQL and run on pooled ``sqlite3`` connections, so that filtering
+happens in SQLite (and may use its indexes) rather than in the Cyclus backend.
+"""
+import os
+import uuid
+import sqlite3
+import threading
+import contextlib
+import urllib.request
+
+from lazyasd import lazyobject
+
+
+OPERATORS = {
+    '<': '<',
+    '<=': '<=',
+    '==': '=',
+    '!=': '!=',
+    '>': '>',
+    '>=': '>=',
+    'in': 'IN',
+    'not in': 'NOT IN',
+    }
+INDEX_COLUMNS = ('Time', 'AgentId')
+AUTO_INDEX = False
+POOL_SIZE = 4
+
+# Cyclus database types (cyclus::DbTypes) that may be read directly from SQLite,
+# mapped to a function converting the stored value.
+_BOOL, _INT, _FLOAT, _DOUBLE, _STRING, _VL_STRING, _BLOB, _UUID = range(8)
+
+
+def _uuid(x):
+    return None if x is None else uuid.UUID(bytes=bytes(x))
+
+
+def _bool(x):
+    return None if x is None else bool(x)
+
+
+# pandas dtypes of the columns of each Cyclus database type, when it is read
+_DTYPES = {
+    _BOOL: 'bool',
+    _INT: 'int64',
+    _FLOAT: 'float64',
+    _DOUBLE: 'float64',
+    }
+# pandas dtypes of columns without a Cyclus database type, by SQLite type affinity
+_AFFINITY_DTYPES = {
+    'INTEGER': 'int64',
+    'REAL': 'float64',
+    'DOUBLE': 'float64',
+    }
+_CONVERTERS = {
+    _BOOL: _bool,
+    _INT: None,
+    _FLOAT: None,
+    _DOUBLE: None,
+    _STRING: None,
+    _VL_STRING: None,
+    _UUID: _uuid,
+    }
+
+
+@lazyobject
+def pd():
+    import pandas
+    return pandas
+
+
+def _ident(name):
+    """Quotes an SQL identifier."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _param(value, dbtype=None):
+    """Converts a condition value into an SQLite parameter, coercing it to the
+    Cyclus database type of its column, as the Cyclus backend does. UUIDs may
+    be given as strings, such as those that arrive in JSON requests.
+    """
+    if dbtype == _UUID and isinstance(value, str):
+        value = uuid.UUID(value)
+    elif dbtype == _BOOL and isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, uuid.UUID):
+        return value.bytes
+    return value
+
+
+def compile_conds(conds, columns):
+    """Compiles Cyclus-style conditions into a parameterized SQL WHERE clause.
+
+    Parameters
+    ----------
+    conds : list of 3-tuples or None
+        Conditions of the form ``(column, operator, value)``, which are all
+        required to hold. Operators may be any of '<', '<=', '==', '!=', '>',
+        '>=', or 'in' and 'not in', whose value must then be a list. Ranges
+        are expressed as two conditions on the same column.
+    columns : collection of str
+        Names of the columns in the table, which the conditions are
+        validated against. If this is a mapping of column names to their
+        Cyclus database types, condition values are coerced to those types.
+
+    Returns
+    -------
+    where : str
+        The WHERE clause, including the keyword, or an empty string if
+        there are no conditions.
+    params : list
+        Parameters for the WHERE clause.
+    """
+    if not conds:
+        return '', []
+    clauses = []
+    params = []
+    for cond in conds:
+        if len(cond) != 3:
+            msg = 'Condition {0!r} must have exactly 3 elements'
+            raise ValueError(msg.format(cond))
+        col, op, value = cond
+        if col not in columns:
+            raise ValueError('Condition column {0!r} not in table'.format(col))
+        if op not in OPERATORS:
+            raise ValueError('Condition operator {0!r} not valid'.format(op))
+        dbtype = columns.get(col, None) if isinstance(columns, dict) else None
+        if op in ('in', 'not in'):
+            if isinstance(value, (str, bytes)) or not hasattr(value, '__iter__'):
+                raise ValueError('Condition value for {0!r} must be a list'.format(op))
+            value = [_param(v, dbtype) for v in value]
+            if len(value) == 0:
+                # nothing is in an empty list, everything is not in it
+                clauses.append('0' if op == 'in' else '1')
+                continue
+            marks = ', '.join(['?'] * len(value))
+            clauses.append('{0} {1} ({2})'.format(_ident(col), OPERATORS[op], marks))
+            params.extend(value)
+        else:
+            clauses.append('{0} {1} ?'.format(_ident(col), OPERATORS[op]))
+            params.append(_param(value, dbtype))
+    return 'WHERE ' + ' AND '.join(clauses), params
+
+
+def _identity(filename):
+    """Identity of the current contents of a file."""
+    st = os.stat(filename)
+    return st.st_ino, st.st_mtime_ns
+
+
+class ConnectionPool(object):
+    """A pool of read-only SQLite connections, per database file. Connections
+    to a file that has since changed are discarded.
+    """
+
+    def __init__(self, maxsize=POOL_SIZE):
+        self.maxsize = maxsize
+        self._pools = {}
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # connections may not be shared with the parent process, so they are
+        # dropped without being closed
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _connect(self, filename):
+        uri = 'file:{0}?mode=ro'.format(
+              urllib.request.pathname2url(os.path.abspath(filename)))
+        return sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+    @contextlib.contextmanager
+    def connection(self, filename):
+        """Context manager that checks out a connection for a database file."""
+        ident = _identity(filename)
+        conn = None
+        with self._lock:
+            pool = self._pools.get(filename, None)
+            if pool is not None and pool[0] != ident:
+                for c in pool[1]:
+                    c.close()
+                pool = None
+            if pool is None:
+                pool = self._pools[filename] = (ident, [])
+            if pool[1]:
+                conn = pool[1].pop()
+        if conn is None:
+            conn = self._connect(filename)
+        try:
+            yield conn
+        except Exception:
+            conn.close()
+            raise
+        with self._lock:
+            pool = self._pools.get(filename, None)
+            if pool is not None and pool[0] == ident and len(pool[1]) < self.maxsize:
+                pool[1].append(conn)
+                conn = None
+        if conn is not None:
+            conn.close()
+
+    def close(self, filename=None):
+        """Closes the connections for a database file, or for all files if
+        filename is None.
+        """
+        with self._lock:
+            filenames = list(self._pools.keys()) if filename is None else [filename]
+            for fname in filenames:
+                pool = self._pools.pop(fname, None)
+                if pool is None:
+                    continue
+                for c in pool[1]:
+                    c.close()
+
+
+POOL = ConnectionPool()
+_INDEXED = set()
+
+
+def create_indexes(filename, table, columns=INDEX_COLUMNS):
+    """Creates indexes on columns of a table in a database file, if they do not
+    already exist. Columns that are not in the table are skipped. Files with
+    more than one link, such as deduplicated outputs, are shared with other
+    paths and the content-addressed store, and so are never modified.
+    """
+    key = (filename, table)
+    if key in _INDEXED:
+        return
+    if os.stat(filename).st_nlink > 1:
+        return
+    conn = sqlite3.connect(filename)
+    try:
+        existing = {row[1] for row in conn.execute(
+                    'PRAGMA table_info({0})'.format(_ident(table)))}
+        for col in columns:
+            if col not in existing:
+                continue
+            name = 'fixie_{0}_{1}'.format(table, col)
+            conn.execute('CREATE INDEX IF NOT EXISTS {0} ON {1} ({2})'.format(
+                         _ident(name), _ident(table), _ident(col)))
+        conn.commit()
+    finally:
+        conn.close()
+    _INDEXED.add(key)
+    POOL.close(filename)
+
+
+def _field_types(conn, table):
+    """Returns the Cyclus database types of the columns of a table, in order,
+    as a list of (column, dbtype) pairs.
+    """
+    info = conn.execute('PRAGMA table_info({0})'.format(_ident(table))).fetchall()
+    cols = [row[1] for row in info]
+    if not cols:
+        raise ValueError('Table {0!r} not in database'.format(table))
+    try:
+        rows = conn.execute('SELECT Field, Type FROM FieldTypes WHERE TableName = ?',
+                            (table,)).fetchall()
+    except sqlite3.Error:
+        rows = []
+    types = dict(rows)
+    return [(col, types.get(col, None)) for col in cols]
+
+
+def schema(filename):
+    """Reads the schema of a Cyclus SQLite database from its metadata, without
+    reading the rows of its tables. Column types are the pandas dtypes that
+    the columns have when their table is queried.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the database file.
+
+    Returns
+    -------
+    tables : dict
+        Maps table names to dicts with 'columns' (a list of dicts with 'name'
+        and 'type' keys) and 'rows' (the number of rows in the table).
+    """
+    tables = {}
+    with POOL.connection(filename) as conn:
+        names = [row[0] for row in conn.execute(
+                 "SELECT name FROM sqlite_master WHERE type = 'table'")]
+        for name in sorted(names):
+            declared = {row[1]: row[2].upper() for row in conn.execute(
+                        'PRAGMA table_info({0})'.format(_ident(name)))}
+            columns = []
+            for col, t in _field_types(conn, name):
+                dtype = _DTYPES.get(t, None) if t is not None else \
+                        _AFFINITY_DTYPES.get(declared[col], None)
+                columns.append({'name': col, 'type': dtype or 'object'})
+            rows = conn.execute('SELECT COUNT(*) FROM {0}'.format(_ident(name)))
+            tables[name] = {'columns': columns, 'rows': rows.fetchone()[0]}
+    return tables
+
+
+def query(filename, table, conds=None, columns=None, index=None):
+    """Queries a table in a Cyclus SQLite database directly.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the database file.
+    table : str
+        Name of the table to query.
+    conds : list of 3-tuples or None, optional
+        Conditions to filter rows with, see ``compile_conds()``.
+    columns : list of str or None, optional
+        Columns to return, default all.
+    index : bool or None, optional
+        Whether to create indexes on the hot columns of the table first. If
+        None, the module-level ``AUTO_INDEX`` flag is used.
+
+    Returns
+    -------
+    table : pandas.DataFrame or None
+        The table, or None if the table holds types that cannot be read
+        directly, in which case the Cyclus backend should be used instead.
+    """
+    if AUTO_INDEX if index is None else index:
+        try:
+            create_indexes(filename, table)
+        except sqlite3.Error:
+            pass  # e.g. the database is read-only, indexes are only an optimization
+    with POOL.connection(filename) as conn:
+        types = _field_types(conn, table)
+        alltypes = dict(types)
+        if columns:
+            for col in columns:
+                if col not in alltypes:
+                    raise ValueError('Column {0!r} not in table'.format(col))
+            types = [(col, alltypes[col]) for col in columns]
+        if any(t not in _CONVERTERS for _, t in types):
+            return None
+        where, params = compile_conds(conds, alltypes)
+        sql = 'SELECT {0} FROM {1} {2}'.format(', '.join(_ident(c) for c, _ in types),
+                                               _ident(table), where)
+        rows = conn.execute(sql, params).fetchall()
+    names = [col for col, _ in types]
+    df = pd.DataFrame.from_records(rows, columns=names)
+    for col, t in types:
+        convert = _CONVERTERS[t]
+        if convert is not None:
+            df[col] = df[col].map(convert)
+    return df
@@ -0,0 +1,189 @@
+"""Tiered storage of simulation outputs. Outputs that have not been accessed
+for a while are moved from the warm tier, where they are kept as is, to the
+cold tier, where they are either compressed in place or moved into a cold
+directory. Cold outputs are still available: they are decompressed as they
+are streamed, and are rehydrated into a bounded scratch directory when they
+need to be queried.
+"""
+import os
+import gzip
+import time
+import shutil
+import hashlib
+import threading
+
+from lazyasd import lazyobject
+
+from fixie import ENV
+
+
+TIER_WARM = 'warm'
+TIER_COLD = 'cold'
+COLD_METHOD = 'compress'  # or 'move'
+COLD_DIR = None  # defaults to $FIXIE_SIMS_DIR/.cold
+SCRATCH_DIR_NAME = '.scratch'
+SCRATCH_BYTES = 8 << 30  # 8 Gb
+SCRATCH_GRACE = 60.0  # seconds that a rehydrated copy is kept after its last use
+CHUNKSIZE = 1 << 20  # 1 Mb
+SUFFIXES = {'zstd': '.zst', 'gzip': '.gz'}
+
+
+@lazyobject
+def zstandard():
+    import zstandard
+    return zstandard
+
+
+def default_codec():
+    """The codec that cold outputs are compressed with, 'zstd' if the
+    zstandard package is installed and 'gzip' otherwise.
+    """
+    try:
+        zstandard.ZstdCompressor
+    except ImportError:
+        return 'gzip'
+    return 'zstd'
+
+
+def cold_dir():
+    """The directory that cold outputs are moved into."""
+    return COLD_DIR or os.path.join(ENV['FIXIE_SIMS_DIR'], '.cold')
+
+
+def scratch_dir():
+    """The directory that cold outputs are rehydrated into."""
+    return os.path.join(ENV['FIXIE_SIMS_DIR'], SCRATCH_DIR_NAME)
+
+
+def _copy(fsrc, fdst):
+    shutil.copyfileobj(fsrc, fdst, CHUNKSIZE)
+
+
+def _compressed_writer(f, codec):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor().stream_writer(f)
+    elif codec == 'gzip':
+        return gzip.GzipFile(fileobj=f, mode='wb', compresslevel=6)
+    raise ValueError('Codec {0!r} not valid'.format(codec))
+
+
+def open_cold(cold_file, codec=None):
+    """Opens a cold output for reading, decompressing it as it is read."""
+    if codec is None:
+        return open(cold_file, 'rb')
+    elif codec == 'zstd':
+        return zstandard.ZstdDecompressor().stream_reader(open(cold_file, 'rb'),
+                                                          closefd=True)
+    elif codec == 'gzip':
+        return gzip.open(cold_file, 'rb')
+    raise ValueError('Codec {0!r} not valid'.format(codec))
+
+
+def freeze(filename, method=None):
+    """Writes the cold copy of an output, leaving the output itself in place so
+    that it may be removed once the cold copy has been recorded.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the output file.
+    method : str or None, optional
+        Either 'compress', to compress the output next to itself, or 'move',
+        to copy it into the cold directory. Default ``COLD_METHOD``.
+
+    Returns
+    -------
+    cold_file : str
+        Path to the cold copy.
+    codec : str or None
+        Codec the cold copy is compressed with, None if it is not compressed.
+    """
+    method = COLD_METHOD if method is None else method
+    if method == 'compress':
+        codec = default_codec()
+        cold_file = filename + SUFFIXES[codec]
+    elif method == 'move':
+        codec = None
+        relname = os.path.relpath(os.path.abspath(filename), ENV['FIXIE_SIMS_DIR'])
+        if relname.startswith(os.pardir):
+            relname = os.path.basename(filename)
+        cold_file = os.path.join(cold_dir(), relname)
+        os.makedirs(os.path.dirname(cold_file), exist_ok=True)
+    else:
+        raise ValueError('Cold storage method {0!r} not valid'.format(method))
+    tmp = cold_file + '.tmp'
+    try:
+        with open(filename, 'rb') as fsrc, open(tmp, 'wb') as fdst:
+            if codec is None:
+                _copy(fsrc, fdst)
+            else:
+                with _compressed_writer(fdst, codec) as writer:
+                    _copy(fsrc, writer)
+        shutil.copystat(filename, tmp)
+        os.replace(tmp, cold_file)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return cold_file, codec
+
+
+def _shrink_scratch(maxbytes, keep=None, grace=None):
+    """Removes the least recently used rehydrated files, other than keep,
+    until the scratch directory holds at most maxbytes. Files used within the
+    last grace seconds (default ``SCRATCH_GRACE``) are kept too, since they
+    may have just been returned by ``rehydrate()`` and not yet been opened.
+    """
+    grace = SCRATCH_GRACE if grace is None else grace
+    recent = time.time() - grace
+    entries = []
+    try:
+        with os.scandir(scratch_dir()) as it:
+            for entry in it:
+                if entry.name.endswith('.tmp') or not entry.is_file():
+                    continue
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+    except OSError:
+        return
+    total = sum(size for _, size, _ in entries)
+    entries.sort()
+    for mtime, size, fname in entries:
+        if total <= maxbytes:
+            break
+        if fname == keep or mtime >= recent:
+            continue
+        try:
+            os.remove(fname)
+        except OSError:
+            continue
+        total -= size
+
+
+def rehydrate(cold_file, codec, ext=''):
+    """Returns a local, uncompressed copy of a cold output in the scratch
+    directory, writing it if needed. The copy keeps the extension of the
+    original output, so that it may be opened as a Cyclus database. The
+    scratch directory is bounded by ``SCRATCH_BYTES``, and the least recently
+    used copies are removed first.
+    """
+    st = os.stat(cold_file)
+    key = '{0}\0{1}\0{2}'.format(os.path.abspath(cold_file), st.st_ino,
+                                 st.st_mtime_ns)
+    name = hashlib.sha256(key.encode()).hexdigest()[:32] + ext
+    local = os.path.join(scratch_dir(), name)
+    if os.path.isfile(local):
+        os.utime(local)
+        return local
+    os.makedirs(scratch_dir(), exist_ok=True)
+    tmp = '{0}.{1}.{2}.tmp'.format(local, os.getpid(), threading.get_ident())
+    try:
+        with open_cold(cold_file, codec) as fsrc, open(tmp, 'wb') as fdst:
+            _copy(fsrc, fdst)
+        os.replace(tmp, local)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    _shrink_scratch(SCRATCH_BYTES, keep=local)
+    return local
@@ -0,0 +1,81 @@
+"""Byte accounting of the simulation outputs held by the fixie data service.
+Usage is kept per user and in total in ``$FIXIE_PATHS_DIR/.usage.json`` and is
+maintained incrementally as paths are added and removed, so that it never
+requires walking the filesystem.
+"""
+import os
+import json
+
+from fixie import ENV, flock
+
+
+USAGE_FILE_NAME = '.usage.json'
+
+
+def usage_file():
+    """The usage file."""
+    return os.path.join(ENV['FIXIE_PATHS_DIR'], USAGE_FILE_NAME)
+
+
+def _read(filename):
+    with open(filename) as f:
+        data = json.load(f)
+    return {user: int(size) for user, size in data.get('users', {}).items()}
+
+
+def _write(filename, users):
+    data = {'total': sum(users.values()), 'users': users}
+    with open(filename, 'w') as f:
+        json.dump(data, f, indent=1)
+
+
+def load_usage(**kwargs):
+    """Loads the per user usage, in bytes, as a dict. Returns None if the usage
+    file does not exist or could not be loaded. Keyword arguments are passed
+    into ``fixie.flock()``.
+    """
+    if 'raise_errors' not in kwargs:
+        kwargs['raise_errors'] = False
+    filename = usage_file()
+    with flock(filename, **kwargs) as lockfd:
+        if lockfd == 0 or not os.path.exists(filename):
+            return None
+        return _read(filename)
+
+
+def dump_usage(users, **kwargs):
+    """Replaces the per user usage, in bytes. Returns whether or not the dump
+    occurred successfully.
+    """
+    if 'raise_errors' not in kwargs:
+        kwargs['raise_errors'] = False
+    filename = usage_file()
+    with flock(filename, **kwargs) as lockfd:
+        if lockfd == 0:
+            return False
+        _write(filename, users)
+    return True
+
+
+def update_usage(deltas, **kwargs):
+    """Adds changes in the number of bytes held, as a dict mapping users to
+    byte deltas, to the usage file. Nothing is done if the usage file does not
+    exist yet, since it will be built in full on first use. Returns whether or
+    not the update occurred successfully.
+    """
+    deltas = {user: int(delta) for user, delta in deltas.items() if delta}
+    if not deltas:
+        return True
+    if 'raise_errors' not in kwargs:
+        kwargs['raise_errors'] = False
+    filename = usage_file()
+    with flock(filename, **kwargs) as lockfd:
+        if lockfd == 0:
+            return False
+        if not os.path.exists(filename):
+            return True
+        users = _read(filename)
+        for user, delta in deltas.items():
+            users[user] = max(users.get(user, 0) + delta, 0)
+        _write(filename, users)
+    return True
@@ -0,0 +1,89 @@
+"""Warm start of the fixie data service. On startup, the outputs that were
+accessed most often, and the columnar sidecars of their most queried tables,
+are preloaded into the page cache, and their schema indexes are loaded, so
+that the first requests after a restart do not all hit cold storage.
+"""
+import os
+import json
+import threading
+
+from fixie_data import columnar
+from fixie_data.paths import _user_path_files, _load_schema
+from fixie_data.tiers import TIER_WARM
+
+
+WARM_PATHS = 32
+WARM_TABLES = 4
+
+
+def hottest_paths(n=WARM_PATHS):
+    """Returns the path infos of the n most accessed warm paths, across all
+    users, from the access counts recorded in the user path files.
+    """
+    infos = []
+    for user_path_file in _user_path_files():
+        try:
+            with open(user_path_file) as f:
+                paths = json.load(f)
+        except Exception:
+            continue
+        infos.extend(info for info in paths.values() if info.get('accesses', 0) > 0
+                     and info.get('tier', TIER_WARM) == TIER_WARM)
+    infos.sort(key=lambda info: (info['accesses'], info.get('accessed', 0)),
+               reverse=True)
+    return infos[:n]
+
+
+def prefetch(filename):
+    """Asks the kernel to read a file into the page cache, without waiting on
+    it. Returns whether or not the request could be made.
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return False
+    try:
+        fd = os.open(filename, os.O_RDONLY)
+    except OSError:
+        return False
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    except OSError:
+        return False
+    finally:
+        os.close(fd)
+    return True
+
+
+def hottest_tables(info, n=WARM_TABLES):
+    """Returns the names of the n most queried tables of a path."""
+    tables = info.get('tables', None) or {}
+    return sorted(tables, key=tables.get, reverse=True)[:n]
+
+
+def warm_start(n=WARM_PATHS):
+    """Warms the caches for the n most accessed paths. The files of all of the
+    paths, and the sidecars of their most queried tables, are prefetched first,
+    and then their schema indexes are loaded. Tables themselves are not read,
+    since the page cache already holds what they would be read from. Errors are
+    ignored, since this is only an optimization.
+    """
+    infos = [info for info in hottest_paths(n) if info.get('file', None)]
+    for info in infos:
+        filename = info['file']
+        prefetch(filename)
+        for name in hottest_tables(info):
+            sidecar = columnar.table_file(filename, name)
+            if sidecar is not None:
+                prefetch(sidecar)
+    for info in infos:
+        try:
+            _load_schema(info['file'])
+        except Exception:
+            continue
+
+
+def start(n=WARM_PATHS):
+    """Starts warming the caches in a background thread, returning the thread."""
+    thread = threading.Thread(target=warm_start, kwargs={'n': n}, daemon=True,
+                              name='fixie-data-warm-start')
+    thread.start()
+    return thread
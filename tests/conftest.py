@@ -15,14 +15,17 @@ import fixie_data.paths
 @pytest.fixture
 def xdg(request):
     """A fixure that creates a temporary XDG base directory and sets
-    $XDG_DATA_HOME={xdg-base}/share and $XDG_CONFIG_HOME={xdg-base}/config.
+    $XDG_DATA_HOME={xdg-base}/share, $XDG_CONFIG_HOME={xdg-base}/config, and
+    $XDG_CACHE_HOME={xdg-base}/cache.
     """
     d = tempfile.mkdtemp()
     data = os.path.join(d, 'share')
     conf = os.path.join(d, 'config')
-    with ENV.swap(XDG_DATA_HOME=data, XDG_CONFIG_HOME=conf):
+    cache = os.path.join(d, 'cache')
+    with ENV.swap(XDG_DATA_HOME=data, XDG_CONFIG_HOME=conf, XDG_CACHE_HOME=cache):
         with environ.context():
             yield d
+            fixie_data.paths.ACCESS_LOG.flush()
     shutil.rmtree(d)
 
 
@@ -36,3 +39,6 @@ def verify_user(monkeypatch):
     monkeypatch.setattr(fixie, 'verify_user', always_verify_user)
     monkeypatch.setattr(fixie.tools, 'verify_user', always_verify_user)
     monkeypatch.setattr(fixie_data.paths, 'verify_user', always_verify_user)
+    fixie_data.paths.invalidate_verification()
+    yield
+    fixie_data.paths.invalidate_verification()
@@ -0,0 +1,46 @@
+"""Access log tests"""
+from fixie_data.access import AccessLog
+
+
+def test_access_log_batches():
+    batches = []
+    def writer(batch):
+        batches.append(batch)
+    log = AccessLog(writer, interval=3600.0)
+    log.record('inigo', '/as', t=1.0)
+    log.record('inigo', ['/as', '/you'], t=2.0)
+    log.record('fezzik', '/wish', t=3.0, table='Info')
+    assert (2.0, 2, {}) == log.get('inigo', '/as')
+    assert [] == batches
+    log.stop()
+    assert 1 == len(batches)
+    assert {'inigo': {'/as': (2.0, 2, {}), '/you': (2.0, 1, {})},
+            'fezzik': {'/wish': (3.0, 1, {'Info': 1})}} == batches[0]
+    assert log.get('inigo', '/as') is None
+
+
+def test_access_log_merge():
+    log = AccessLog(lambda batch: None, interval=3600.0)
+    info = {'path': '/as', 'accessed': 5.0, 'accesses': 2}
+    log.record('inigo', '/as', t=7.0)
+    obs = log.merge('inigo', info)
+    assert {'path': '/as', 'accessed': 7.0, 'accesses': 3} == obs
+    assert 2 == info['accesses']
+    obs = log.merge('inigo', {'path': '/you'})
+    assert {'path': '/you', 'accessed': None, 'accesses': 0} == obs
+    log.stop()
+
+
+def test_access_log_retries_failures():
+    calls = []
+    def writer(batch):
+        calls.append(batch)
+        if len(calls) == 1:
+            return batch
+    log = AccessLog(writer, interval=3600.0)
+    log.record('inigo', '/as', t=1.0, table='Info')
+    log.flush()
+    assert (1.0, 1, {'Info': 1}) == log.get('inigo', '/as')
+    log.stop()
+    assert log.get('inigo', '/as') is None
+    assert 2 == len(calls)
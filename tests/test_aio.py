@@ -0,0 +1,61 @@
+"""Asynchronous paths API tests"""
+import os
+import asyncio
+
+from fixie import ENV
+
+from fixie_data.aio import alistpaths, ainfo, afetch, adelete, agc
+
+from test_paths import _init_user_paths
+
+
+def _run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def test_alistpaths(xdg, verify_user):
+    user = 'westley'
+    given = _init_user_paths(user)
+    paths, status, msg = _run(alistpaths(user, '42', timeout=10.0))
+    assert status, msg
+    assert ['/as', '/wish', '/you'] == paths
+
+
+def test_ainfo_concurrent(xdg, verify_user):
+    user = 'humperdinck'
+    given = _init_user_paths(user)
+    async def many():
+        return await asyncio.gather(*[ainfo(user, '42', pattern='*s*', timeout=10.0)
+                                      for i in range(10)])
+    for infos, status, msg in _run(many()):
+        assert status, msg
+        assert ['/as', '/wish'] == [i['path'] for i in infos]
+
+
+def test_afetch_adelete(xdg, verify_user):
+    user = 'rugen'
+    given = _init_user_paths(user)
+    fname = os.path.join(ENV['FIXIE_SIMS_DIR'], '0.txt')
+    with open(fname, 'w') as f:
+        f.write('as you wish')
+    obs, status, msg = _run(afetch('/as', user, '42', url=False, timeout=10.0))
+    assert status, msg
+    assert b'as you wish' == obs
+    status, msg = _run(adelete('/as', user, '42', timeout=10.0))
+    assert status, msg
+    assert not os.path.exists(fname)
+
+
+def test_agc(xdg, verify_user):
+    user = 'valerie'
+    given = _init_user_paths(user)
+    fname = os.path.join(ENV['FIXIE_SIMS_DIR'], '1.h5')
+    with open(fname, 'w') as f:
+        f.write('as you wish')
+    status, msg = _run(agc(timeout=10.0))
+    assert status, msg
+    assert not os.path.exists(fname)
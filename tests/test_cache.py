@@ -0,0 +1,105 @@
+"""Cache tests"""
+import os
+
+import pytest
+
+from fixie_data.cache import TTLCache, DiskCache
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+def test_ttl_cache_expires():
+    clock = Clock()
+    cache = TTLCache(maxsize=10, ttl=5.0, timer=clock)
+    cache['a'] = 1
+    assert 1 == cache.get('a')
+    clock.t = 4.0
+    assert 'a' in cache
+    clock.t = 5.0
+    assert cache.get('a') is None
+    assert 0 == len(cache)
+
+
+def test_ttl_cache_bounded():
+    cache = TTLCache(maxsize=2, ttl=60.0)
+    cache['a'] = 1
+    cache['b'] = 2
+    cache.get('a')  # makes 'b' the least recently used
+    cache['c'] = 3
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert 'c' in cache
+
+
+def test_ttl_cache_invalidate():
+    cache = TTLCache()
+    cache['a'] = 1
+    cache['b'] = 2
+    cache['c'] = 3
+    cache.invalidate('a')
+    assert 'a' not in cache
+    cache.prune(lambda k, v: v == 2)
+    assert 'b' not in cache
+    assert 'c' in cache
+    cache.invalidate()
+    assert 0 == len(cache)
+
+
+def test_ttl_cache_hit_rate():
+    cache = TTLCache()
+    assert 0.0 == cache.hit_rate
+    cache['a'] = 1
+    cache.get('a')
+    cache.get('a')
+    cache.get('a')
+    cache.get('b')
+    assert 0.75 == cache.hit_rate
+    stats = cache.stats()
+    assert 3 == stats['hits']
+    assert 1 == stats['misses']
+
+
+def test_disk_cache(tmpdir):
+    d = str(tmpdir)
+    cache = DiskCache(d)
+    assert cache.get(('a', 1)) is None
+    cache.set(('a', 1), {'x': [1, 2]})
+    assert {'x': [1, 2]} == cache.get(('a', 1))
+    # another process sees the same cache through the directory
+    other = DiskCache(lambda: d)
+    assert {'x': [1, 2]} == other.get(('a', 1))
+    cache.invalidate(('a', 1))
+    assert other.get(('a', 1)) is None
+    assert 0.5 == cache.hit_rate
+
+
+def test_disk_cache_bounded(tmpdir):
+    cache = DiskCache(str(tmpdir), maxbytes=4096)
+    for i in range(10):
+        cache.set(i, b'x' * 1000)
+        t = 1000.0 + i
+        os.utime(cache._file(i), (t, t))
+    cache.shrink()
+    kept = [i for i in range(10) if cache.get(i) is not None]
+    # the most recently used values are kept
+    assert kept == list(range(10 - len(kept), 10))
+    assert 0 < len(kept) <= 4
+
+
+def test_disk_cache_not_private(tmpdir):
+    d = str(tmpdir.join('shared'))
+    cache = DiskCache(d)
+    cache.set('a', 1)
+    assert 0o700 == os.stat(d).st_mode & 0o777
+    # values are not read from, nor written to, a directory others may write to
+    os.chmod(d, 0o777)
+    assert cache.get('a') is None
+    with pytest.raises(PermissionError):
+        cache.set('b', 2)
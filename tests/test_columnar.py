@@ -0,0 +1,46 @@
+"""Columnar sidecar tests"""
+import os
+
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from fixie_data import columnar
+from fixie_data.sqlite import query
+
+from test_sqlite import SIMID, _make_db
+
+
+def _convert(fname):
+    tables = [(name, query(fname, name)) for name in ['TimeSeriesPower']]
+    return columnar.write(fname, tables)
+
+
+def test_write_query(tmpdir):
+    fname = str(tmpdir.join('out.sqlite'))
+    _make_db(fname, n=100)
+    assert ['TimeSeriesPower'] == _convert(fname)
+    assert columnar.is_current(fname)
+    df = columnar.query(fname, 'TimeSeriesPower')
+    assert 100 == len(df)
+    assert SIMID == df['SimId'][0]
+    df = columnar.query(fname, 'TimeSeriesPower', columns=['Time', 'Value'],
+                        conds=[['Time', '>=', 90], ['AgentId', '==', 10],
+                               ['SimId', 'in', [SIMID]]])
+    assert ['Time', 'Value'] == list(df.columns)
+    assert [90, 92, 94, 96, 98] == list(df['Time'])
+    df = columnar.query(fname, 'TimeSeriesPower', conds=[['SimId', '==', SIMID.hex]])
+    assert 100 == len(df)
+    assert columnar.query(fname, 'Nope') is None
+    assert os.path.isfile(columnar.table_file(fname, 'TimeSeriesPower'))
+    assert columnar.table_file(fname, 'Nope') is None
+
+
+def test_out_of_date(tmpdir):
+    fname = str(tmpdir.join('out.sqlite'))
+    _make_db(fname)
+    _convert(fname)
+    os.remove(fname)
+    _make_db(fname, n=3)
+    assert not columnar.is_current(fname)
+    assert columnar.query(fname, 'TimeSeriesPower') is None
@@ -0,0 +1,64 @@
+"""Content-addressed deduplication tests"""
+import os
+
+from fixie import json
+from fixie import ENV
+
+import fixie_data.paths
+from fixie_data.dedup import dedup_file, prune_store, store_dir
+from fixie_data.paths import resolve_pending_paths, delete, gc
+
+
+def _write(fname, s):
+    with open(fname, 'w') as f:
+        f.write(s)
+
+
+def test_dedup_file(xdg):
+    sims = ENV['FIXIE_SIMS_DIR']
+    a, b, c = [os.path.join(sims, x + '.h5') for x in 'abc']
+    _write(a, 'as you wish')
+    _write(b, 'as you wish')
+    _write(c, 'inconceivable')
+    da, db, dc = dedup_file(a), dedup_file(b), dedup_file(c)
+    assert da == db
+    assert da != dc
+    assert os.path.samefile(a, b)
+    assert not os.path.samefile(a, c)
+    assert 3 == os.stat(a).st_nlink
+    # nothing to prune while outputs link to the store
+    assert 0 == prune_store()[0]
+    os.remove(a)
+    assert 0 == prune_store()[0]
+    os.remove(b)
+    os.remove(c)
+    assert 2 == prune_store()[0]
+    assert [] == os.listdir(os.path.join(store_dir(), da[:2]))
+
+
+def test_resolve_pending_paths_dedup(xdg, verify_user):
+    user = 'westley'
+    sims = ENV['FIXIE_SIMS_DIR']
+    pending_dir = os.path.join(ENV['FIXIE_PATHS_DIR'], user, 'pending')
+    os.makedirs(pending_dir)
+    for i in range(2):
+        fname = os.path.join(sims, '{0}.h5'.format(i))
+        _write(fname, 'as you wish')
+        pp = {'user': user, 'holding': 'inf', 'path': '/' + str(i), 'file': fname,
+              'jobid': i}
+        with open(os.path.join(pending_dir, str(i) + '.json'), 'w') as f:
+            json.dump(pp, f)
+    paths = resolve_pending_paths(user, dedup=True, timeout=10.0)
+    # wait for the background deduplication
+    fixie_data.paths._background_executor().submit(lambda: None).result()
+    paths = resolve_pending_paths(user, timeout=10.0)
+    assert paths['/0']['digest'] == paths['/1']['digest']
+    assert os.path.samefile(paths['/0']['file'], paths['/1']['file'])
+    # the store is pruned once no path references it
+    for path in ['/0', '/1']:
+        status, msg = delete(path, user, '42', timeout=10.0)
+        assert status, msg
+    status, msg = gc(timeout=10.0)
+    assert status, msg
+    d = paths['/0']['digest']
+    assert [] == os.listdir(os.path.join(store_dir(), d[:2]))
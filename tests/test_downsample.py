@@ -0,0 +1,64 @@
+"""Downsampling tests"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from fixie_data.downsample import stride, minmax, lttb, downsample_table
+
+
+def _series(n=1000):
+    x = np.arange(n, dtype=float)
+    y = np.sin(x / 50.0)
+    if n > 123:
+        y[123] = 10.0  # a spike that should not be lost
+    return x, y
+
+
+@pytest.mark.parametrize('select', [stride, minmax, lttb])
+def test_keeps_endpoints(select):
+    x, y = _series()
+    idx = select(x, y, 50)
+    assert len(idx) <= 50
+    assert 0 == idx[0]
+    assert len(x) - 1 == idx[-1]
+    assert (np.diff(idx) > 0).all()
+
+
+@pytest.mark.parametrize('points', [1, 2])
+def test_lttb_few_points(points):
+    x, y = _series()
+    assert points == len(lttb(x, y, points))
+
+
+@pytest.mark.parametrize('select', [minmax, lttb])
+def test_keeps_spike(select):
+    x, y = _series()
+    assert 123 in select(x, y, 50)
+
+
+@pytest.mark.parametrize('select', [stride, minmax, lttb])
+def test_short_series(select):
+    x, y = _series(10)
+    assert list(range(10)) == list(select(x, y, 50))
+
+
+def test_downsample_table():
+    n = 500
+    tbl = pd.DataFrame({'AgentId': np.tile([1, 2], n),
+                        'Time': np.repeat(np.arange(n), 2),
+                        'Value': np.arange(2 * n, dtype=float)})
+    obs = downsample_table(tbl, 50, method='lttb')
+    for agent in (1, 2):
+        series = obs[obs['AgentId'] == agent]
+        assert 50 == len(series)
+        assert [0, n - 1] == [series['Time'].iloc[0], series['Time'].iloc[-1]]
+    # all rows are kept when the table is small enough
+    assert tbl is downsample_table(tbl, 2 * n)
+
+
+def test_downsample_table_invalid():
+    tbl = pd.DataFrame({'Time': [1, 2, 3], 'Value': [1.0, 2.0, 3.0]})
+    with pytest.raises(ValueError):
+        downsample_table(tbl, 2, method='nope')
+    with pytest.raises(ValueError):
+        downsample_table(tbl, 2, y='Quantity')
@@ -0,0 +1,17 @@
+"""Garbage collection entry point tests"""
+import os
+
+from fixie import ENV
+
+from fixie_data.gc import main
+from fixie_data.paths import resolve_pending_paths
+
+from test_paths import _init_sized_paths
+
+
+def test_main(xdg, verify_user):
+    _init_sized_paths('wesley', [10, 10, 10], accessed=[3.0, 1.0, 2.0])
+    assert 0 == main(['--max-bytes', '15', '--timeout', '10'])
+    paths = resolve_pending_paths('wesley', timeout=10.0)
+    assert {'/0'} == set(paths.keys())
+    assert not os.path.exists(os.path.join(ENV['FIXIE_SIMS_DIR'], 'wesley-1.h5'))
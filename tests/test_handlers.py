@@ -1,17 +1,21 @@
 """Tests handlers object."""
 import os
 import time
+import uuid
 import subprocess
 
+import pandas as pd
 import pytest
 import tornado.web
+from tornado import gen
 from tornado.httpclient import HTTPError
 from fixie import json
 from fixie import ENV, fetch
 
-from fixie_data.handlers import HANDLERS
+from fixie_data.handlers import HANDLERS, ArrowWriter
+from fixie_data.paths import gc
 
-from test_paths import _init_user_paths
+from test_paths import _init_user_paths, _init_sweep, _init_sqlite_path
 
 
 SIMULATION = {
@@ -84,6 +88,18 @@ def test_info_valid(xdg, verify_user, http_client, base_url):
     assert exp == obs
 
 
+@pytest.mark.gen_test
+def test_info_concurrent(xdg, verify_user, http_client, base_url):
+    user = "inigo"
+    given = _write_simple_files(user)
+    url = base_url + '/info'
+    body = {"user": user, "token": "42", "pattern": "*s*"}
+    obs = yield gen.multi([fetch(url, body) for i in range(10)])
+    for o in obs:
+        assert o['status'], o['message']
+        assert ['/as', '/wish'] == [i['path'] for i in o['infos']]
+
+
 @pytest.mark.gen_test
 def test_fetch_valid(xdg, verify_user, http_client, base_url):
     user = "inigo"
@@ -106,6 +122,23 @@ def test_fetch_valid(xdg, verify_user, http_client, base_url):
     assert response.body == b'as you wish 2'
 
 
+@pytest.mark.gen_test
+def test_fetch_cold(xdg, verify_user, http_client, base_url):
+    user = "inigo"
+    given = _write_simple_files(user)
+    status, msg = gc(cold_after=0.0, timeout=10.0)
+    assert status, msg
+    url = base_url + '/fetch'
+    body = {"path": "/as", "user": user, "token": "42", 'url': True}
+    obs = yield fetch(url, body)
+    assert obs['status'], obs['message']
+    assert 'codec=' in obs['file']
+    # the file is decompressed as it is downloaded
+    response = yield http_client.fetch(base_url + obs['file'], method="GET")
+    assert response.code == 200
+    assert response.body == b'as you wish 0'
+
+
 @pytest.mark.gen_test
 def test_delete_valid(xdg, verify_user, http_client, base_url):
     user = "inigo"
@@ -119,6 +152,23 @@ def test_delete_valid(xdg, verify_user, http_client, base_url):
     assert '0.txt' not in os.listdir(ENV['FIXIE_SIMS_DIR'])
 
 
+@pytest.mark.gen_test
+def test_delete_many_valid(xdg, verify_user, http_client, base_url):
+    user = "inigo"
+    given = _write_simple_files(user)
+    url = base_url + '/delete'
+    body = {"pattern": "*s*", "user": user, "token": "42"}
+    obs = yield fetch(url, body)
+    exp = {'results': {'/as': [True, 'File removed'],
+                       '/wish': [True, 'File removed']},
+           'status': True, 'message': 'Files removed'}
+    assert exp == obs
+    sims = os.listdir(ENV['FIXIE_SIMS_DIR'])
+    assert '0.txt' not in sims
+    assert '2.txt' not in sims
+    assert '1.h5' in sims
+
+
 @pytest.mark.gen_test
 def test_table_valid(xdg, verify_user, http_client, base_url):
     user = "inigo"
@@ -135,6 +185,98 @@ def test_table_valid(xdg, verify_user, http_client, base_url):
     assert obs['table']
 
 
+@pytest.mark.gen_test
+def test_table_downsample(xdg, verify_user, http_client, base_url):
+    user = "inigo"
+    _init_sqlite_path(user, n=1000)
+    url = base_url + '/table'
+    body = {"name": "TimeSeriesPower", "path": "/out", "user": user, "token": "42",
+            "orient": "records", "downsample": {"points": 100, "method": "lttb"}}
+    obs = yield fetch(url, body)
+    assert obs['status'], obs['message']
+    assert 200 == len(obs['table'])
+
+
+@pytest.mark.gen_test
+def test_compare_ndjson(xdg, verify_user, http_client, base_url):
+    user = "inigo"
+    given = _init_sweep(user)
+    url = base_url + '/compare'
+    body = {"name": "Info", "pattern": "/sweep/*", "user": user, "token": "42"}
+    response = yield http_client.fetch(url, method="POST", body=json.dumps(body))
+    assert response.code == 200
+    lines = response.body.decode('utf-8').splitlines()
+    records = [json.loads(line) for line in lines]
+    assert sorted(given.keys()) == [r['path'] for r in records]
+
+
+@pytest.mark.gen_test
+def test_compare_arrow(xdg, verify_user, http_client, base_url):
+    pa = pytest.importorskip('pyarrow')
+    import pyarrow.ipc
+    user = "inigo"
+    given = _init_sweep(user)
+    url = base_url + '/compare'
+    body = {"name": "Info", "pattern": "/sweep/*", "user": user, "token": "42",
+            "format": "arrow"}
+    response = yield http_client.fetch(url, method="POST", body=json.dumps(body))
+    assert response.code == 200
+    tbl = pa.ipc.open_stream(response.body).read_all().to_pandas()
+    assert sorted(given.keys()) == list(tbl['path'])
+
+
+def test_arrow_writer_casts_to_first_schema():
+    pa = pytest.importorskip('pyarrow')
+    import pyarrow.ipc
+    simid = uuid.uuid4()
+    writer = ArrowWriter()
+    b = writer.write(pd.DataFrame({'SimId': [None, simid], 'Time': [0, 1]}))
+    # empty tables have object columns, and ints may have become floats
+    b += writer.write(pd.DataFrame({'SimId': pd.Series([], dtype=object),
+                                    'Time': pd.Series([], dtype=object)}))
+    b += writer.write(pd.DataFrame({'SimId': [simid], 'Time': [2.0]}))
+    # tables that cannot be cast are skipped
+    b += writer.write(pd.DataFrame({'SimId': [simid], 'Time': [2.5]}))
+    b += writer.close()
+    tbl = pa.ipc.open_stream(b).read_all().to_pandas()
+    assert [0, 1, 2] == list(tbl['Time'])
+    assert [None, str(simid), str(simid)] == list(tbl['SimId'])
+
+
+@pytest.mark.gen_test
+def test_compare_json(xdg, verify_user, http_client, base_url):
+    user = "inigo"
+    given = _init_sweep(user)
+    url = base_url + '/compare'
+    body = {"name": "Info", "pattern": "/sweep/*", "user": user, "token": "42",
+            "format": "json:dict", "orient": "records"}
+    obs = yield fetch(url, body)
+    assert obs['status'], obs['message']
+    assert sorted(given.keys()) == [r['path'] for r in obs['table']]
+
+
+@pytest.mark.gen_test
+def test_schema_valid(xdg, verify_user, http_client, base_url):
+    user = "inigo"
+    given = _init_user_paths(user)
+    sim = json.dumps(SIMULATION)
+    out = os.path.join(ENV['FIXIE_SIMS_DIR'], '1.h5')
+    cmd = ['cyclus', '-o', out, '-f', 'json', sim]
+    subprocess.check_call(cmd)
+    url = base_url + '/schema'
+    body = {"path": "/you", "user": user, "token": "42"}
+    obs = yield fetch(url, body)
+    assert obs['status'], obs['message']
+    assert 'Info' in obs['schema']
+    # once the index is built, the schema is served without a scheduler slot
+    response = yield http_client.fetch(base_url + '/metrics', method="GET")
+    admitted = json.loads(response.body.decode('utf-8'))['scheduler']['admitted']
+    obs = yield fetch(url, body)
+    assert obs['status'], obs['message']
+    response = yield http_client.fetch(base_url + '/metrics', method="GET")
+    assert admitted == json.loads(response.body.decode('utf-8'))['scheduler']['admitted']
+
+
 @pytest.mark.gen_test
 def test_gc_valid(xdg, verify_user, http_client, base_url):
     user = "inigo"
@@ -146,3 +288,18 @@ def test_gc_valid(xdg, verify_user, http_client, base_url):
     exp = {'status': True, 'message': ''}
     assert exp == obs
     assert '1.h5' not in os.listdir(ENV['FIXIE_SIMS_DIR'])
+
+
+@pytest.mark.gen_test
+def test_metrics(xdg, verify_user, http_client, base_url):
+    user = "inigo"
+    given = _write_simple_files(user)
+    body = {"path": "/as", "user": user, "token": "42", 'url': False}
+    obs = yield fetch(base_url + '/fetch', body)
+    assert obs['status'], obs['message']
+    response = yield http_client.fetch(base_url + '/metrics', method="GET")
+    assert response.code == 200
+    obs = json.loads(response.body.decode('utf-8'))
+    assert obs['status']
+    assert 1 == obs['scheduler']['admitted']
+    assert 0 == obs['scheduler']['running']
@@ -0,0 +1,39 @@
+"""Import time tests. The heavy dependencies of fixie-data (pandas, Cyclus,
+pyarrow) should only be imported when they are first used, so that the server,
+and command line tools like ``python -m fixie_data.gc``, start quickly.
+"""
+import sys
+import json
+import subprocess
+
+import pytest
+
+
+IMPORT_BUDGET = 2.0  # seconds
+HEAVY_MODULES = ('pandas', 'numpy', 'cyclus', 'pyarrow')
+
+SCRIPT = """
+import sys, time, json
+t0 = time.perf_counter()
+import {0}
+t = time.perf_counter() - t0
+heavy = [m for m in {1!r} if m in sys.modules]
+print(json.dumps({{'time': t, 'heavy': heavy}}))
+"""
+
+
+def _import(module):
+    script = SCRIPT.format(module, HEAVY_MODULES)
+    out = subprocess.check_output([sys.executable, '-c', script])
+    return json.loads(out.decode().splitlines()[-1])
+
+
+@pytest.mark.parametrize('module', [
+    'fixie_data.paths',
+    'fixie_data.handlers',
+    'fixie_data.gc',
+    ])
+def test_import(module):
+    obs = _import(module)
+    assert [] == obs['heavy']
+    assert obs['time'] < IMPORT_BUDGET
@@ -0,0 +1,43 @@
+"""Paths directory migration tests"""
+import os
+
+from fixie import json
+from fixie import ENV
+
+from fixie_data.migrate import migrate
+from fixie_data.paths import resolve_pending_paths
+
+from test_paths import (_init_user_paths, _init_pending_paths, _user_path_file,
+    _legacy_user_path_file)
+
+
+def test_migrate(xdg):
+    users = ['bob', 'bobby', 'bob-x']
+    given = {user: _init_user_paths(user, legacy=True) for user in users}
+    pending = {user: _init_pending_paths(user, legacy=True) for user in users}
+    status, msg = migrate(timeout=10.0)
+    assert status, msg
+    for user in users:
+        assert os.path.isfile(_user_path_file(user))
+        assert not os.path.exists(_legacy_user_path_file(user))
+        pending_dir = os.path.join(ENV['FIXIE_PATHS_DIR'], user, 'pending')
+        assert len(pending[user]) == len(os.listdir(pending_dir))
+    assert [] == [f for f in os.listdir(ENV['FIXIE_PATHS_DIR'])
+                  if f.endswith('.json')]
+    # the server stops looking for the old flat layout
+    assert os.path.isfile(os.path.join(ENV['FIXIE_PATHS_DIR'], '.migrated'))
+    for user in users:
+        with open(_user_path_file(user)) as f:
+            paths = json.load(f)
+        assert set(given[user].keys()) == set(paths.keys())
+
+
+def test_migrate_twice(xdg):
+    user = 'fezzik'
+    given = _init_user_paths(user, legacy=True)
+    status, msg = migrate(timeout=10.0)
+    assert status, msg
+    status, msg = migrate(timeout=10.0)
+    assert status, msg
+    paths = resolve_pending_paths(user, timeout=10.0)
+    assert set(given.keys()) == set(paths.keys())
@@ -2,16 +2,25 @@
 import os
 import glob
 import time
+import shutil
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from collections.abc import Mapping
 
 import pandas as pd
+import pytest
 
 from fixie import json
 from fixie import ENV
 
+import fixie_data.paths
+from fixie_data import columnar
 from fixie_data.paths import (resolve_pending_paths, listpaths, info, fetch,
-    delete, table, gc)
+    delete, delete_many, table, compare, schema, is_schema_indexed, usage, gc,
+    invalidate_verification, VERIFY_CACHE, STAT_CACHE, SCANDIR_THRESHOLD, ACCESS_LOG, PATHS_CACHE, QUERY_CACHE)
+from fixie_data.sqlite import query as sqlite_query
+
+from test_sqlite import SIMID, _make_db
 
 
 SIMULATION = {
@@ -50,8 +59,13 @@ SIMULATION = {
 }
 
 
-def _init_pending_paths(user):
-    pptemp = ENV['FIXIE_PATHS_DIR'] + '/' + user + '-{0}-pending-path.json'
+def _init_pending_paths(user, legacy=False):
+    if legacy:
+        pptemp = ENV['FIXIE_PATHS_DIR'] + '/' + user + '-{0}-pending-path.json'
+    else:
+        pending_dir = os.path.join(ENV['FIXIE_PATHS_DIR'], user, 'pending')
+        os.makedirs(pending_dir, exist_ok=True)
+        pptemp = pending_dir + '/{0}.json'
     pps = [{'user': user, 'holding': 'inf', 'path': '/hey'},
            {'user': user, 'holding': 42.0, 'path': '/there/is/it'},
            {'user': user, 'holding': '1e300', 'path': '/me/you/are-looking-for'},
@@ -65,11 +79,19 @@ def _init_pending_paths(user):
 
 
 def _user_path_file(user):
+    return ENV['FIXIE_PATHS_DIR'] + '/' + user + '/paths.json'
+
+
+def _legacy_user_path_file(user):
     return ENV['FIXIE_PATHS_DIR'] + '/' + user + '.json'
 
 
-def _init_user_paths(user):
-    upf = _user_path_file(user)
+def _init_user_paths(user, legacy=False):
+    if legacy:
+        upf = _legacy_user_path_file(user)
+    else:
+        upf = _user_path_file(user)
+        os.makedirs(os.path.dirname(upf), exist_ok=True)
     sims = ENV['FIXIE_SIMS_DIR']
     paths = {
         '/as': {'user': user, 'holding': 'inf', 'path': '/as',
@@ -149,6 +171,109 @@ def test_resolve_pending_paths_all(xdg):
     assert exp_paths == obs_paths
 
 
+def test_resolve_pending_paths_concurrent(xdg):
+    user = 'miracle-max'
+    given = _init_user_paths(user)
+    pps = _init_pending_paths(user)
+    exp_paths = {pp['path'] for pp in pps}
+    exp_paths.update(given.keys())
+    # threads that find the same pending files must not fail or lose paths
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda i: resolve_pending_paths(user, timeout=10.0),
+                                    range(8)))
+    for paths in results:
+        assert exp_paths == set(paths.keys())
+    with open(_user_path_file(user)) as f:
+        assert exp_paths == set(json.load(f).keys())
+
+
+def test_verification_cache(xdg, monkeypatch):
+    calls = []
+    def counting_verify_user(user, token):
+        calls.append((user, token))
+        return True, 'User verified', True
+    monkeypatch.setattr(fixie_data.paths, 'verify_user', counting_verify_user)
+    invalidate_verification()
+    user = 'the-albino'
+    given = _init_user_paths(user)
+    for i in range(3):
+        paths, status, msg = listpaths(user, '42', timeout=10.0)
+        assert status, msg
+    assert 1 == len(calls)
+    assert VERIFY_CACHE.hit_rate > 0.0
+    # invalidating the user forces re-verification
+    invalidate_verification(user)
+    paths, status, msg = listpaths(user, '42', timeout=10.0)
+    assert 2 == len(calls)
+    invalidate_verification()
+
+
+def test_resolve_pending_paths_migrated(xdg, monkeypatch):
+    # once migrated, the top-level paths dir is no longer listed
+    user = 'bob'
+    _init_pending_paths(user, legacy=True)
+    with open(os.path.join(ENV['FIXIE_PATHS_DIR'], '.migrated'), 'w'):
+        pass
+    listed = []
+    listdir = os.listdir
+
+    def recording_listdir(path):
+        listed.append(path)
+        return listdir(path)
+
+    monkeypatch.setattr(fixie_data.paths.os, 'listdir', recording_listdir)
+    paths = resolve_pending_paths(user)
+    assert {} == paths
+    assert ENV['FIXIE_PATHS_DIR'] not in listed
+    # and reading paths does not create the user directory
+    assert not os.path.exists(os.path.dirname(_user_path_file(user)))
+
+
+def test_resolve_pending_paths_legacy(xdg):
+    # set up system in the old flat layout
+    user = 'bob'
+    given = _init_user_paths(user, legacy=True)
+    pps = _init_pending_paths(user, legacy=True)
+    others = _init_pending_paths('bobby', legacy=True)
+    # resolve the pending paths we just created.
+    paths = resolve_pending_paths(user)
+    exp_paths = {pp['path'] for pp in pps}
+    exp_paths.update(given.keys())
+    assert exp_paths == set(paths.keys())
+    for pp in pps:
+        assert not os.path.exists(pp['file'])
+    # the user is now in the sharded layout
+    assert os.path.exists(_user_path_file(user))
+    assert not os.path.exists(_legacy_user_path_file(user))
+    # other users whose names share a prefix are left alone
+    for pp in others:
+        assert os.path.exists(pp['file'])
+    paths = resolve_pending_paths('bobby')
+    assert {pp['path'] for pp in others} == set(paths.keys())
+
+
+def test_resolve_pending_paths_shared_dash_prefix(xdg):
+    # 'bob' and 'bob-x' both match 'bob-*' in the old flat layout
+    pps = _init_pending_paths('bob-x', legacy=True)
+    paths = resolve_pending_paths('bob')
+    assert {} == paths
+    for pp in pps:
+        assert os.path.exists(pp['file'])
+
+
+def test_gc_legacy(xdg, verify_user):
+    user = 'valerie'
+    given = _init_user_paths(user, legacy=True)
+    fname = os.path.join(ENV['FIXIE_SIMS_DIR'], '1.h5')
+    with open(fname, 'w') as f:
+        f.write('as you wish')
+    status, msg = gc(timeout=10.0)
+    assert status, msg
+    assert not os.path.exists(fname)
+    paths = resolve_pending_paths(user, timeout=10.0)
+    assert {'/as', '/wish'} == set(paths.keys())
+
+
 def test_listpaths(xdg, verify_user):
     user = 'westley'
     given = _init_user_paths(user)
@@ -162,6 +287,27 @@ def test_listpaths(xdg, verify_user):
     assert exp == paths
 
 
+def test_listpaths_cached(xdg, verify_user, monkeypatch):
+    monkeypatch.setattr(fixie_data.paths, 'PATHS_CACHE_SETTLE', 0.0)
+    user = 'westley'
+    given = _init_user_paths(user)
+    paths, status, msg = listpaths(user, '42', timeout=10.0)
+    assert ['/as', '/wish', '/you'] == paths
+    assert _user_path_file(user) in PATHS_CACHE
+    # another process changes the paths file
+    given['/inconceivable'] = dict(given['/as'], path='/inconceivable')
+    with open(_user_path_file(user), 'w') as f:
+        json.dump(given, f)
+    paths, status, msg = listpaths(user, '42', timeout=10.0)
+    assert ['/as', '/inconceivable', '/wish', '/you'] == paths
+
+
+def _strip_access(infos):
+    """Removes access tracking fields from path infos."""
+    return [{k: v for k, v in i.items() if k not in ('accessed', 'accesses')}
+            for i in infos]
+
+
 def test_info(xdg, verify_user):
     user = 'humperdinck'
     given = _init_user_paths(user)
@@ -169,29 +315,62 @@ def test_info(xdg, verify_user):
     exp = []
     for p, i in sorted(given.items()):
         i['holding'] = float(i['holding'])
+        i['tier'] = 'warm'
         exp.append(i)
     infos, status, msg = info(user, '42', timeout=10.0)
     assert status
-    assert exp == infos
+    assert exp == _strip_access(infos)
     # s-pattern, no paths
     infos, status, msg = info(user, '42', pattern='*s*', timeout=10.0)
     assert status
-    assert exp[:2] == infos
+    assert exp[:2] == _strip_access(infos)
     # no pattern, single path
     infos, status, msg = info(user, '42', paths='/you', timeout=10.0)
     assert status
-    assert exp[-1:] == infos
+    assert exp[-1:] == _strip_access(infos)
     # no pattern, paths
     infos, status, msg = info(user, '42', paths=['/you', 'non-exist', '/wish'],
                               timeout=10.0)
     assert status
-    assert exp[-2:][::-1] == infos
+    assert exp[-2:][::-1] == _strip_access(infos)
     # pattern and paths
     infos, status, msg = info(user, '42', pattern='*s*', paths='/you', timeout=10.0)
     assert not status
     assert infos is None
 
 
+def test_access_tracking(xdg, verify_user):
+    user = 'inigo'
+    given = _init_user_paths(user)
+    fname = os.path.join(ENV['FIXIE_SIMS_DIR'], '0.txt')
+    with open(fname, 'w') as f:
+        f.write('as you wish')
+    upf = _user_path_file(user)
+    mtime = os.stat(upf).st_mtime_ns
+    for i in range(3):
+        obs, status, msg = fetch('/as', user, '42', url=True, timeout=10.0)
+        assert status, msg
+    # accesses are not written synchronously
+    assert mtime == os.stat(upf).st_mtime_ns
+    infos, status, msg = info(user, '42', paths='/as', timeout=10.0)
+    assert status, msg
+    assert 3 == infos[0]['accesses']
+    assert infos[0]['accessed'] is not None
+    # after a flush, the accesses are in the path store
+    ACCESS_LOG.flush()
+    with open(upf) as f:
+        paths = json.load(f)
+    assert 3 == paths['/as']['accesses']
+    assert 'accesses' not in paths['/you']
+    # listing paths is not an access
+    accessed = paths['/as']['accessed']
+    infos, status, msg = info(user, '42', timeout=10.0)
+    infos, status, msg = info(user, '42', paths='/as', timeout=10.0)
+    assert 3 == infos[0]['accesses']
+    assert accessed == infos[0]['accessed']
+    assert ACCESS_LOG.get(user, '/you') is None
+
+
 def test_fetch_bytes(xdg, verify_user):
     user = 'rugen'
     given = _init_user_paths(user)
@@ -230,6 +409,73 @@ def test_delete(xdg, verify_user):
     assert '/as' not in paths
 
 
+def test_delete_many(xdg, verify_user):
+    user = 'count-rugen'
+    given = _init_user_paths(user)
+    for i in range(3):
+        fname = os.path.join(ENV['FIXIE_SIMS_DIR'], str(i) + '.txt')
+        with open(fname, 'w') as f:
+            f.write('as you wish')
+    # pattern selection
+    results, status, msg = delete_many(user, '42', pattern='*s*', timeout=10.0)
+    assert status, msg
+    assert {'/as', '/wish'} == set(results.keys())
+    assert not os.path.exists(os.path.join(ENV['FIXIE_SIMS_DIR'], '0.txt'))
+    assert not os.path.exists(os.path.join(ENV['FIXIE_SIMS_DIR'], '2.txt'))
+    paths = resolve_pending_paths(user, timeout=10.0)
+    assert {'/you'} == set(paths.keys())
+    # missing paths are reported per path
+    results, status, msg = delete_many(user, '42', paths=['/as', '/you'],
+                                       timeout=10.0)
+    assert not status
+    assert not results['/as'][0]
+    assert not results['/you'][0]  # 1.h5 was never written
+
+
+def test_delete_many_older_than(xdg, verify_user):
+    user = 'dread-pirate-roberts'
+    given = _init_user_paths(user)
+    for i in range(3):
+        fname = os.path.join(ENV['FIXIE_SIMS_DIR'], str(i) + '.txt')
+        with open(fname, 'w') as f:
+            f.write('as you wish')
+    # only /wish was created long ago
+    results, status, msg = delete_many(user, '42', older_than=3600.0, timeout=10.0)
+    assert status, msg
+    assert {'/wish'} == set(results.keys())
+    paths = resolve_pending_paths(user, timeout=10.0)
+    assert {'/as', '/you'} == set(paths.keys())
+    # no selectors is an error
+    results, status, msg = delete_many(user, '42', timeout=10.0)
+    assert not status
+    assert results is None
+
+
+def test_delete_many_keeps_concurrent_updates(xdg, verify_user, monkeypatch):
+    user = 'vizzini'
+    given = _init_user_paths(user)
+    for i in range(3):
+        fname = os.path.join(ENV['FIXIE_SIMS_DIR'], str(i) + '.txt')
+        with open(fname, 'w') as f:
+            f.write('as you wish')
+    remove_file = fixie_data.paths._remove_file
+
+    def remove_and_resolve(filename):
+        # another worker resolves a new path while the files are removed
+        def add(paths):
+            paths['/inconceivable'] = {'user': user, 'holding': 'inf',
+                                       'path': '/inconceivable', 'jobid': 3}
+            return True
+        fixie_data.paths._update_user_paths(user, add, timeout=10.0)
+        return remove_file(filename)
+
+    monkeypatch.setattr(fixie_data.paths, '_remove_file', remove_and_resolve)
+    results, status, msg = delete_many(user, '42', pattern='*s*', timeout=10.0)
+    assert status, msg
+    paths = resolve_pending_paths(user, timeout=10.0)
+    assert {'/you', '/inconceivable'} == set(paths.keys())
+
+
 def test_table(xdg, verify_user):
     user = 'yellin'
     given = _init_user_paths(user)
@@ -247,6 +493,185 @@ def test_table(xdg, verify_user):
     assert isinstance(tbl1, Mapping)
 
 
+def _init_sqlite_path(user, n=10):
+    """Creates the path '/out' for a user, which points to an SQLite database
+    laid out like a Cyclus output file. Returns the database file name.
+    """
+    fname = os.path.join(ENV['FIXIE_SIMS_DIR'], 'out.sqlite')
+    _make_db(fname, n=n)
+    given = {'/out': {'user': user, 'holding': 'inf', 'path': '/out',
+                      'created': time.time(), 'file': fname, 'jobid': 1}}
+    os.makedirs(os.path.dirname(_user_path_file(user)), exist_ok=True)
+    with open(_user_path_file(user), 'w') as f:
+        json.dump(given, f)
+    return fname
+
+
+def test_table_query_cache(xdg, verify_user, monkeypatch):
+    monkeypatch.setattr(fixie_data.paths, 'QUERY_CACHE_MIN_TIME', 0.0)
+    user = 'yellin'
+    fname = _init_sqlite_path(user)
+    hits = QUERY_CACHE.hits
+    tbl0, status, msg = table('TimeSeriesPower', '/out', user, '42',
+                              conds=[['Time', '<', 4]], format='json:dict')
+    assert status, msg
+    tbl1, status, msg = table('TimeSeriesPower', '/out', user, '42',
+                              conds=[['Time', '<', 4]], format='json:dict')
+    assert status, msg
+    assert tbl0 == tbl1
+    assert hits + 1 == QUERY_CACHE.hits
+    # changing the file invalidates the cached result
+    os.remove(fname)
+    _make_db(fname, n=2)
+    tbl2, status, msg = table('TimeSeriesPower', '/out', user, '42',
+                              conds=[['Time', '<', 4]], format='json:dict')
+    assert status, msg
+    assert 2 == len(tbl2['Time'])
+    # the cache is private to the server, not in the shared sims dir
+    assert not QUERY_CACHE.directory.startswith(ENV['FIXIE_SIMS_DIR'])
+    assert 0o700 == os.stat(QUERY_CACHE.directory).st_mode & 0o777
+
+
+def test_table_sqlite_uuid_string(xdg, verify_user):
+    user = 'yellin'
+    _init_sqlite_path(user)
+    # UUIDs arrive in JSON requests as strings
+    tbl, status, msg = table('TimeSeriesPower', '/out', user, '42',
+                             conds=[['SimId', '==', str(SIMID)], ['Time', '<', 3]])
+    assert status, msg
+    assert [0, 1, 2] == list(tbl['Time'])
+
+
+def test_table_removed_behind_stat_cache(xdg, verify_user):
+    user = 'yellin'
+    fname = _init_sqlite_path(user)
+    tbl, status, msg = table('TimeSeriesPower', '/out', user, '42')
+    assert status, msg
+    # another process removes the file while its stat is still cached
+    os.remove(fname)
+    tbl, status, msg = table('TimeSeriesPower', '/out', user, '42')
+    assert tbl is None
+    assert not status
+
+
+def test_table_downsample(xdg, verify_user):
+    user = 'yellin'
+    _init_sqlite_path(user, n=1000)
+    tbl, status, msg = table('TimeSeriesPower', '/out', user, '42',
+                             downsample={'points': 20, 'method': 'minmax'})
+    assert status, msg
+    # 20 points for each of the two agents
+    assert 40 == len(tbl)
+    assert {10, 11} == set(tbl['AgentId'])
+    tbl, status, msg = table('TimeSeriesPower', '/out', user, '42',
+                             downsample={'points': 20, 'method': 'nope'})
+    assert not status
+    assert tbl is None
+
+
+def test_table_columnar(xdg, verify_user):
+    pytest.importorskip('pyarrow')
+    user = 'yellin'
+    fname = _init_sqlite_path(user, n=100)
+    columnar.write(fname, [('TimeSeriesPower', sqlite_query(fname, 'TimeSeriesPower'))])
+    tbl, status, msg = table('TimeSeriesPower', '/out', user, '42',
+                             conds=[['Time', '<', 4]])
+    assert status, msg
+    assert [0, 1, 2, 3] == list(tbl['Time'])
+    # the sidecar is removed with its output
+    status, msg = delete('/out', user, '42')
+    assert status, msg
+    assert not os.path.exists(columnar.sidecar_dir(fname))
+
+
+def test_table_columnar_after_queries(xdg, verify_user, monkeypatch):
+    user = 'yellin'
+    fname = _init_sqlite_path(user)
+    submitted = []
+    monkeypatch.setattr(fixie_data.paths, 'COLUMNAR_AFTER_QUERIES', 2)
+    monkeypatch.setattr(fixie_data.paths, '_submit_conversion', submitted.append)
+    # fetches are not queries
+    for i in range(3):
+        obs, status, msg = fetch('/out', user, '42', timeout=10.0)
+        assert status, msg
+    tbl, status, msg = table('TimeSeriesPower', '/out', user, '42')
+    assert status, msg
+    assert [] == submitted
+    tbl, status, msg = table('TimeSeriesPower', '/out', user, '42')
+    assert status, msg
+    assert [fname] == submitted
+
+
+def _init_sweep(user, n=3):
+    """Creates n paths for a user that point to copies of the same Cyclus output."""
+    sim = json.dumps(SIMULATION)
+    sims = ENV['FIXIE_SIMS_DIR']
+    out = os.path.join(sims, 'sweep-0.h5')
+    cmd = ['cyclus', '-o', out, '-f', 'json', sim]
+    subprocess.check_call(cmd)
+    paths = {}
+    for i in range(n):
+        fname = os.path.join(sims, 'sweep-{0}.h5'.format(i))
+        if i > 0:
+            shutil.copy(out, fname)
+        path = '/sweep/' + str(i)
+        paths[path] = {'user': user, 'holding': 'inf', 'path': path,
+                       'created': time.time(), 'file': fname, 'jobid': i}
+    upf = _user_path_file(user)
+    os.makedirs(os.path.dirname(upf), exist_ok=True)
+    with open(upf, 'w') as f:
+        json.dump(paths, f, indent=1)
+    return paths
+
+
+def test_compare(xdg, verify_user):
+    user = 'yellin'
+    given = _init_sweep(user)
+    tbl, status, msg = compare('Info', '/sweep/*', user, '42', columns=['Handle'])
+    assert status, msg
+    assert isinstance(tbl, pd.DataFrame)
+    assert ['path', 'Handle'] == list(tbl.columns)
+    assert sorted(given.keys()) == list(tbl['path'])
+    # no matching paths
+    tbl, status, msg = compare('Info', '/nope/*', user, '42')
+    assert not status
+    assert tbl is None
+
+
+def test_schema(xdg, verify_user):
+    user = 'yellin'
+    given = _init_user_paths(user)
+    sim = json.dumps(SIMULATION)
+    out = os.path.join(ENV['FIXIE_SIMS_DIR'], '1.h5')
+    cmd = ['cyclus', '-o', out, '-f', 'json', sim]
+    subprocess.check_call(cmd)
+    assert not is_schema_indexed('/you', user, '42')
+    tables, status, msg = schema('/you', user, '42')
+    assert status, msg
+    assert is_schema_indexed('/you', user, '42')
+    assert 'Info' in tables
+    assert tables['Info']['rows'] == 1
+    assert 'Handle' in [c['name'] for c in tables['Info']['columns']]
+    # the index is stored next to the file and removed with it
+    assert os.path.isfile(out + '.schema.json')
+    again, status, msg = schema('/you', user, '42')
+    assert tables == again
+    status, msg = delete('/you', user, '42')
+    assert status, msg
+    assert not os.path.exists(out + '.schema.json')
+
+
+def test_schema_sqlite(xdg, verify_user, monkeypatch):
+    user = 'yellin'
+    fname = _init_sqlite_path(user, n=5)
+    # SQLite databases are indexed without reading their tables
+    monkeypatch.setattr(fixie_data.paths, '_open_db', None)
+    tables, status, msg = schema('/out', user, '42')
+    assert status, msg
+    assert 5 == tables['TimeSeriesPower']['rows']
+    assert 'Time' in [c['name'] for c in tables['TimeSeriesPower']['columns']]
+
+
 def test_gc(xdg, verify_user):
     user = 'valerie'
     given = _init_user_paths(user)
@@ -261,3 +686,181 @@ def test_gc(xdg, verify_user):
     assert obs == set(glob.iglob(ENV['FIXIE_SIMS_DIR'] + '/*.h5'))
     paths = resolve_pending_paths(user, timeout=10.0)
     assert {'/as', '/wish'} == set(paths.keys())
+
+
+def test_gc_legacy_layout(xdg, verify_user, monkeypatch):
+    user = 'westley'
+    given = _init_user_paths(user, legacy=True)
+    for fname in ['0.txt', '1.h5', '2.txt']:
+        with open(os.path.join(ENV['FIXIE_SIMS_DIR'], fname), 'w') as f:
+            f.write('as you wish')
+    locked = []
+    flock = fixie_data.paths.flock
+
+    def recording_flock(filename, **kwargs):
+        locked.append(filename)
+        return flock(filename, **kwargs)
+
+    monkeypatch.setattr(fixie_data.paths, 'flock', recording_flock)
+    status, msg = gc(timeout=10.0)
+    assert status, msg
+    # the user's paths are locked by the same file as every other writer
+    assert {_user_path_file(user)} == {f for f in locked if user in f}
+    assert not os.path.exists(_legacy_user_path_file(user))
+    paths = resolve_pending_paths(user, timeout=10.0)
+    assert {'/as'} == set(paths.keys())
+
+
+def test_stat_cache_consistent_after_delete(xdg, verify_user):
+    user = 'yellin'
+    given = _init_user_paths(user)
+    fname = os.path.join(ENV['FIXIE_SIMS_DIR'], '0.txt')
+    with open(fname, 'w') as f:
+        f.write('as you wish')
+    obs, status, msg = fetch('/as', user, '42', url=True, timeout=10.0)
+    assert status, msg
+    assert fname in STAT_CACHE
+    status, msg = delete('/as', user, '42', timeout=10.0)
+    assert status, msg
+    assert fname not in STAT_CACHE
+
+
+def test_gc_many_files(xdg, verify_user):
+    user = 'brute-squad'
+    sims = ENV['FIXIE_SIMS_DIR']
+    n = 2 * SCANDIR_THRESHOLD
+    paths = {}
+    for i in range(n):
+        path = '/sweep/' + str(i)
+        fname = os.path.join(sims, 'sweep-{0}.h5'.format(i))
+        paths[path] = {'user': user, 'holding': 0.0, 'path': path,
+                       'created': time.time(), 'file': fname, 'jobid': i}
+        # only write every other file
+        if i % 2 == 0:
+            with open(fname, 'w') as f:
+                f.write('as you wish')
+    os.makedirs(os.path.dirname(_user_path_file(user)), exist_ok=True)
+    with open(_user_path_file(user), 'w') as f:
+        json.dump(paths, f, indent=1)
+    status, msg = gc(timeout=10.0)
+    assert status, msg
+    assert [] == glob.glob(os.path.join(sims, 'sweep-*.h5'))
+    # the paths with missing files are kept, as before
+    paths = resolve_pending_paths(user, timeout=10.0)
+    assert {'/sweep/' + str(i) for i in range(1, n, 2)} == set(paths.keys())
+
+
+def _init_sized_paths(user, sizes, accessed=None):
+    """Creates pending paths for a user with files of the given sizes, and
+    resolves them.
+    """
+    pending_dir = os.path.join(ENV['FIXIE_PATHS_DIR'], user, 'pending')
+    os.makedirs(pending_dir, exist_ok=True)
+    for i, size in enumerate(sizes):
+        fname = os.path.join(ENV['FIXIE_SIMS_DIR'], '{0}-{1}.h5'.format(user, i))
+        with open(fname, 'wb') as f:
+            f.write(b'x' * size)
+        pp = {'user': user, 'holding': 'inf', 'path': '/' + str(i), 'file': fname,
+              'jobid': i}
+        with open(os.path.join(pending_dir, str(i) + '.json'), 'w') as f:
+            json.dump(pp, f)
+    paths = resolve_pending_paths(user, timeout=10.0)
+    if accessed is not None:
+        for i, t in enumerate(accessed):
+            paths['/' + str(i)]['accessed'] = t
+        with open(_user_path_file(user), 'w') as f:
+            json.dump(paths, f, indent=1)
+    return paths
+
+
+def test_usage(xdg, verify_user):
+    _init_sized_paths('wesley', [10, 20])
+    obs, status, msg = usage('wesley', '42', timeout=10.0)
+    assert status, msg
+    assert {'user': 30, 'total': 30} == obs
+    # now maintained incrementally
+    _init_sized_paths('buttercup', [5])
+    obs, status, msg = usage('wesley', '42', timeout=10.0)
+    assert {'user': 30, 'total': 35} == obs
+    status, msg = delete('/1', 'wesley', '42', timeout=10.0)
+    assert status, msg
+    obs, status, msg = usage('wesley', '42', timeout=10.0)
+    assert {'user': 10, 'total': 15} == obs
+
+
+def test_usage_unsized_paths(xdg, verify_user):
+    # paths resolved before sizes were recorded are measured on rebuild
+    paths = _init_sized_paths('miracle-max', [10, 20])
+    for info in paths.values():
+        del info['size']
+    with open(_user_path_file('miracle-max'), 'w') as f:
+        json.dump(paths, f, indent=1)
+    obs, status, msg = usage('miracle-max', '42', timeout=10.0)
+    assert status, msg
+    assert {'user': 30, 'total': 30} == obs
+    with open(_user_path_file('miracle-max')) as f:
+        paths = json.load(f)
+    assert [10, 20] == [paths[p]['size'] for p in sorted(paths)]
+
+
+def test_gc_cold_after(xdg, verify_user):
+    now = time.time()
+    paths = _init_sized_paths('fezzik', [1000, 1000], accessed=[now - 100.0, now])
+    fname = paths['/0']['file']
+    status, msg = gc(cold_after=50.0, timeout=10.0)
+    assert status, msg
+    # only the idle path is moved to the cold tier, and it holds fewer bytes
+    infos, status, msg = info('fezzik', '42', timeout=10.0)
+    assert ['cold', 'warm'] == [i['tier'] for i in infos]
+    assert not os.path.exists(fname)
+    assert os.path.isfile(infos[0]['cold_file'])
+    obs, status, msg = usage('fezzik', '42', timeout=10.0)
+    assert obs['user'] < 2000
+    # and its contents may still be fetched
+    b, status, msg = fetch('/0', 'fezzik', '42', url=False, timeout=10.0)
+    assert status, msg
+    assert b'x' * 1000 == b
+    # removing the path removes the cold file
+    status, msg = delete('/0', 'fezzik', '42', timeout=10.0)
+    assert status, msg
+    assert not os.path.exists(infos[0]['cold_file'])
+
+
+def test_table_cold(xdg, verify_user, monkeypatch):
+    monkeypatch.setattr(fixie_data.paths, 'QUERY_CACHE', None)
+    user = 'yellin'
+    fname = _init_sqlite_path(user)
+    status, msg = gc(cold_after=0.0, timeout=10.0)
+    assert status, msg
+    assert not os.path.exists(fname)
+    tbl, status, msg = table('TimeSeriesPower', '/out', user, '42',
+                             conds=[['Time', '<', 4]])
+    assert status, msg
+    assert [0, 1, 2, 3] == list(tbl['Time'])
+
+
+def test_gc_max_bytes(xdg, verify_user):
+    _init_sized_paths('wesley', [10, 10, 10], accessed=[3.0, 1.0, 2.0])
+    obs, status, msg = usage('wesley', '42', timeout=10.0)
+    assert 30 == obs['total']
+    status, msg = gc(max_bytes=15, timeout=10.0)
+    assert status, msg
+    # the two least recently used paths are evicted
+    paths = resolve_pending_paths('wesley', timeout=10.0)
+    assert {'/0'} == set(paths.keys())
+    obs, status, msg = usage('wesley', '42', timeout=10.0)
+    assert 10 == obs['total']
+
+
+def test_gc_max_user_bytes(xdg, verify_user):
+    _init_sized_paths('wesley', [10, 10], accessed=[1.0, 2.0])
+    _init_sized_paths('buttercup', [10])
+    usage('wesley', '42', timeout=10.0)
+    # nothing is old enough to be evicted
+    status, msg = gc(max_user_bytes=10, min_holding=3600.0, timeout=10.0)
+    assert status, msg
+    assert 2 == len(resolve_pending_paths('wesley', timeout=10.0))
+    status, msg = gc(max_user_bytes=10, timeout=10.0)
+    assert status, msg
+    assert {'/1'} == set(resolve_pending_paths('wesley', timeout=10.0).keys())
+    assert {'/0'} == set(resolve_pending_paths('buttercup', timeout=10.0).keys())
@@ -0,0 +1,90 @@
+"""Fair-share scheduler tests"""
+import asyncio
+
+import pytest
+
+from fixie_data.scheduler import FairScheduler, Rejected
+
+from test_aio import _run
+
+
+async def _hold(s, user, order, delay=0.01):
+    async with s.slot(user):
+        order.append(user)
+        await asyncio.sleep(delay)
+
+
+def test_fair_order():
+    s = FairScheduler(slots=1, max_queue=10)
+    order = []
+
+    async def main():
+        # one user floods the queue before another user arrives
+        tasks = [asyncio.ensure_future(_hold(s, 'vizzini', order)) for _ in range(4)]
+        await asyncio.sleep(0)
+        tasks += [asyncio.ensure_future(_hold(s, 'fezzik', order)) for _ in range(2)]
+        await asyncio.gather(*tasks)
+
+    _run(main())
+    # the second user does not wait for the first user's whole backlog
+    assert ['vizzini', 'vizzini', 'fezzik', 'vizzini', 'fezzik', 'vizzini'] == order
+    stats = s.stats()
+    assert 6 == stats['admitted']
+    assert 0 == stats['queued']
+    assert 0 == stats['running']
+
+
+def test_weights():
+    s = FairScheduler(slots=1, max_queue=10, weights={'fezzik': 2.0})
+    order = []
+
+    async def main():
+        blocker = asyncio.ensure_future(_hold(s, 'inigo', order))
+        await asyncio.sleep(0)
+        tasks = [asyncio.ensure_future(_hold(s, 'vizzini', order)) for _ in range(2)]
+        tasks += [asyncio.ensure_future(_hold(s, 'fezzik', order)) for _ in range(4)]
+        await asyncio.gather(blocker, *tasks)
+
+    _run(main())
+    assert ['inigo', 'fezzik', 'vizzini', 'fezzik', 'fezzik', 'vizzini',
+            'fezzik'] == order
+
+
+def test_queue_full():
+    s = FairScheduler(slots=1, max_queue=1)
+    order = []
+
+    async def main():
+        first = asyncio.ensure_future(_hold(s, 'vizzini', order))
+        second = asyncio.ensure_future(_hold(s, 'vizzini', order))
+        await asyncio.sleep(0)
+        with pytest.raises(Rejected):
+            await s.acquire('vizzini')
+        # other users may still queue
+        third = asyncio.ensure_future(_hold(s, 'fezzik', order))
+        await asyncio.gather(first, second, third)
+
+    _run(main())
+    assert 1 == s.stats()['rejected']['queue_full']
+    assert 3 == len(order)
+
+
+def test_deadline():
+    s = FairScheduler(slots=1)
+    order = []
+
+    async def main():
+        blocker = asyncio.ensure_future(_hold(s, 'vizzini', order, delay=0.2))
+        await asyncio.sleep(0)
+        with pytest.raises(Rejected):
+            await s.acquire('fezzik', deadline=0.01)
+        await blocker
+        # the slot is free again once the blocker is done
+        await asyncio.wait_for(s.acquire('fezzik', deadline=0.01), 1.0)
+        s.release()
+
+    _run(main())
+    stats = s.stats()
+    assert 1 == stats['rejected']['deadline']
+    assert 0 == stats['running']
+    assert 0 == stats['queued']
@@ -0,0 +1,119 @@
+"""Direct SQLite query tests"""
+import os
+import uuid
+import sqlite3
+
+import pytest
+
+from fixie_data.sqlite import compile_conds, query, create_indexes, schema
+
+
+SIMID = uuid.UUID('0123456789abcdef0123456789abcdef')
+
+
+def _make_db(fname, n=10):
+    """Makes a database laid out like a Cyclus SQLite output file."""
+    conn = sqlite3.connect(fname)
+    conn.execute('CREATE TABLE FieldTypes (TableName TEXT, Field TEXT, Type INTEGER)')
+    conn.execute('CREATE TABLE TimeSeriesPower (SimId BLOB, AgentId INTEGER, '
+                 'Time INTEGER, Value REAL)')
+    conn.executemany('INSERT INTO FieldTypes VALUES (?, ?, ?)',
+                     [('TimeSeriesPower', 'SimId', 7),
+                      ('TimeSeriesPower', 'AgentId', 1),
+                      ('TimeSeriesPower', 'Time', 1),
+                      ('TimeSeriesPower', 'Value', 3)])
+    conn.executemany('INSERT INTO TimeSeriesPower VALUES (?, ?, ?, ?)',
+                     [(SIMID.bytes, 10 + i % 2, i, 1.5 * i) for i in range(n)])
+    conn.execute('CREATE TABLE Compositions (QualId INTEGER, Data BLOB)')
+    conn.executemany('INSERT INTO FieldTypes VALUES (?, ?, ?)',
+                     [('Compositions', 'QualId', 1),
+                      ('Compositions', 'Data', 25)])
+    conn.commit()
+    conn.close()
+
+
+def test_compile_conds():
+    cols = {'Time', 'AgentId'}
+    where, params = compile_conds([['Time', '>=', 2], ['Time', '<', 5],
+                                   ['AgentId', 'in', [10, 11]]], cols)
+    assert 'WHERE "Time" >= ? AND "Time" < ? AND "AgentId" IN (?, ?)' == where
+    assert [2, 5, 10, 11] == params
+    assert ('', []) == compile_conds(None, cols)
+
+
+def test_compile_conds_coerce():
+    cols = {'SimId': 7, 'Flag': 0, 'Time': 1}
+    where, params = compile_conds([['SimId', '==', str(SIMID)],
+                                   ['SimId', 'in', [SIMID.hex]],
+                                   ['Flag', '==', True]], cols)
+    assert [SIMID.bytes, SIMID.bytes, 1] == params
+    with pytest.raises(ValueError):
+        compile_conds([['SimId', '==', 'not-a-uuid']], cols)
+
+
+@pytest.mark.parametrize('conds', [
+    [['Nope', '==', 1]],
+    [['Time', 'like', 1]],
+    [['Time', 'in', 1]],
+    [['Time', '==']],
+])
+def test_compile_conds_invalid(conds):
+    with pytest.raises(ValueError):
+        compile_conds(conds, {'Time'})
+
+
+def test_query(tmpdir):
+    fname = str(tmpdir.join('out.sqlite'))
+    _make_db(fname)
+    df = query(fname, 'TimeSeriesPower')
+    assert 10 == len(df)
+    assert SIMID == df['SimId'][0]
+    df = query(fname, 'TimeSeriesPower', conds=[['Time', '>=', 2], ['Time', '<', 8],
+                                                ['AgentId', 'in', [11]]],
+               columns=['Time', 'Value'])
+    assert ['Time', 'Value'] == list(df.columns)
+    assert [3, 5, 7] == list(df['Time'])
+    # compound types are left to the Cyclus backend
+    assert query(fname, 'Compositions') is None
+    with pytest.raises(ValueError):
+        query(fname, 'NotATable')
+
+
+def test_create_indexes(tmpdir):
+    fname = str(tmpdir.join('out.sqlite'))
+    _make_db(fname)
+    df = query(fname, 'TimeSeriesPower', conds=[['Time', '<', 3]], index=True)
+    assert [0, 1, 2] == list(df['Time'])
+    conn = sqlite3.connect(fname)
+    names = {row[0] for row in conn.execute(
+             "SELECT name FROM sqlite_master WHERE type = 'index'")}
+    conn.close()
+    assert {'fixie_TimeSeriesPower_Time', 'fixie_TimeSeriesPower_AgentId'} == names
+
+
+def test_create_indexes_skips_linked_files(tmpdir):
+    fname = str(tmpdir.join('out.sqlite'))
+    _make_db(fname)
+    os.link(fname, str(tmpdir.join('stored.sqlite')))
+    with open(fname, 'rb') as f:
+        before = f.read()
+    df = query(fname, 'TimeSeriesPower', conds=[['Time', '<', 3]], index=True)
+    assert [0, 1, 2] == list(df['Time'])
+    # deduplicated files are shared, so they are left unchanged
+    with open(fname, 'rb') as f:
+        assert before == f.read()
+
+
+def test_schema(tmpdir):
+    fname = str(tmpdir.join('out.sqlite'))
+    _make_db(fname, n=7)
+    tables = schema(fname)
+    assert ['Compositions', 'FieldTypes', 'TimeSeriesPower'] == sorted(tables)
+    tsp = tables['TimeSeriesPower']
+    assert 7 == tsp['rows']
+    assert [{'name': 'SimId', 'type': 'object'},
+            {'name': 'AgentId', 'type': 'int64'},
+            {'name': 'Time', 'type': 'int64'},
+            {'name': 'Value', 'type': 'float64'}] == tsp['columns']
+    # columns without a Cyclus type fall back to their SQLite type
+    assert 'int64' == tables['FieldTypes']['columns'][2]['type']
@@ -0,0 +1,62 @@
+"""Tiered storage tests"""
+import os
+
+import pytest
+
+from fixie import ENV
+
+from fixie_data import tiers
+
+
+def _output(name='out.h5', size=10000):
+    fname = os.path.join(ENV['FIXIE_SIMS_DIR'], name)
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+    with open(fname, 'wb') as f:
+        f.write(b'as you wish ' * (size // 12))
+    return fname
+
+
+@pytest.mark.parametrize('method', ['compress', 'move'])
+def test_freeze(xdg, method):
+    fname = _output()
+    with open(fname, 'rb') as f:
+        exp = f.read()
+    cold_file, codec = tiers.freeze(fname, method=method)
+    assert cold_file != fname
+    # the output itself is left in place
+    assert os.path.isfile(fname)
+    if method == 'compress':
+        assert codec in tiers.SUFFIXES
+        assert os.path.getsize(cold_file) < len(exp)
+    else:
+        assert codec is None
+        assert cold_file.startswith(tiers.cold_dir())
+    with tiers.open_cold(cold_file, codec) as f:
+        assert exp == f.read()
+
+
+def test_freeze_invalid(xdg):
+    fname = _output()
+    with pytest.raises(ValueError):
+        tiers.freeze(fname, method='nope')
+
+
+def test_rehydrate(xdg, monkeypatch):
+    monkeypatch.setattr(tiers, 'SCRATCH_BYTES', 15000)
+    cold = []
+    for i in range(3):
+        fname = _output('{0}.h5'.format(i))
+        cold.append(tiers.freeze(fname))
+    local0 = tiers.rehydrate(*cold[0], ext='.h5')
+    assert local0.endswith('.h5')
+    assert local0.startswith(tiers.scratch_dir())
+    assert local0 == tiers.rehydrate(*cold[0], ext='.h5')
+    os.utime(local0, (1.0, 1.0))
+    # the scratch directory only holds one output, the least recently used goes
+    local1 = tiers.rehydrate(*cold[1], ext='.h5')
+    assert not os.path.exists(local0)
+    assert os.path.isfile(local1)
+    # copies used within the grace window are kept, even over the bound
+    local2 = tiers.rehydrate(*cold[2], ext='.h5')
+    assert os.path.isfile(local1)
+    assert os.path.isfile(local2)
@@ -0,0 +1,66 @@
+"""Warm start tests"""
+import os
+
+from fixie import json
+from fixie import ENV
+
+import fixie_data.warm
+from fixie_data.warm import hottest_paths, hottest_tables, prefetch, warm_start
+
+from test_paths import _init_user_paths, _user_path_file
+
+
+def _init_accessed_paths(user):
+    given = _init_user_paths(user)
+    given['/as'].update(accesses=1, accessed=5.0)
+    given['/you'].update(accesses=10, accessed=1.0, tables={'Info': 1, 'Agents': 3})
+    given['/wish'].update(accesses=10, accessed=2.0)
+    with open(_user_path_file(user), 'w') as f:
+        json.dump(given, f, indent=1)
+    for i in range(3):
+        with open(os.path.join(ENV['FIXIE_SIMS_DIR'], '{0}.txt'.format(i)), 'w') as f:
+            f.write('as you wish')
+    return given
+
+
+def test_hottest_paths(xdg):
+    given = _init_accessed_paths('inigo')
+    _init_user_paths('fezzik')  # never accessed
+    obs = [info['path'] for info in hottest_paths()]
+    assert ['/wish', '/you', '/as'] == obs
+    obs = [info['path'] for info in hottest_paths(n=1)]
+    assert ['/wish'] == obs
+
+
+def test_hottest_tables():
+    info = {'tables': {'Info': 1, 'Agents': 3, 'Resources': 2}}
+    assert ['Agents', 'Resources'] == hottest_tables(info, n=2)
+    assert [] == hottest_tables({})
+
+
+def test_prefetch(xdg):
+    fname = os.path.join(ENV['FIXIE_SIMS_DIR'], '0.txt')
+    with open(fname, 'w') as f:
+        f.write('as you wish')
+    assert prefetch(fname) == hasattr(os, 'posix_fadvise')
+    assert not prefetch(fname + '.nope')
+
+
+def test_warm_start(xdg):
+    given = _init_accessed_paths('inigo')
+    # outputs that are not Cyclus databases are skipped without error
+    warm_start()
+
+
+def test_warm_start_prefetches_sidecars(xdg, monkeypatch):
+    given = _init_accessed_paths('inigo')
+    prefetched = []
+    monkeypatch.setattr(fixie_data.warm, 'prefetch', prefetched.append)
+    monkeypatch.setattr(fixie_data.warm.columnar, 'table_file',
+                        lambda filename, name: filename + '.' + name)
+    warm_start()
+    you = given['/you']['file']
+    assert you in prefetched
+    # the most queried tables are prefetched from their sidecars
+    assert [you + '.Agents', you + '.Info'] == \
+           [f for f in prefetched if f.startswith(you + '.')]